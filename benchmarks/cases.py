@@ -0,0 +1,243 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Awaitable, Callable, Union
+
+    Case = Callable[[], Union[None, Awaitable[None]]]
+
+# name: function that sets up the benchmark and returns the timed callable.
+# setup can be async for cases that need a running event loop.
+cases: dict[str, Callable] = dict()
+
+
+def case(name: str):
+    """
+    Decorator: registers a benchmark case.
+
+    Args:
+        name: str
+    """
+
+    def function_collector(f):
+        cases[name] = f
+        return f
+
+    return function_collector
+
+
+def setup_storage() -> None:
+    """
+    Use a throwaway database and cache directory. Runs once before all cases.
+    """
+    from milo.handler.database import sqlitedb, tables
+    from milo.helpers.tts_cache import tts_cache
+    from milo.mods.settings import insert_default_settings_from_file
+
+    directory = tempfile.mkdtemp(prefix="milo-bench-")
+    tts_cache.directory = os.path.join(directory, "tts")
+    sqlitedb.init(
+        os.path.join(directory, "db.sqlite"), pragmas={"foreign_keys": 1}
+    )
+    sqlitedb.connect()
+    sqlitedb.create_tables(tables, safe=True)
+    insert_default_settings_from_file("server")
+
+
+def fake_message(content: str, guild_id: int = 1):
+    from loadtest.fakes import FakeAuthor, FakeChannel, FakeGuild, FakeMessage
+
+    channel = FakeChannel(FakeGuild(guild_id))
+    return FakeMessage(content, FakeAuthor("bench", admin=True), channel)
+
+
+def fake_dc_handler():
+    from milo.handler.discord import DiscordHandler
+
+    return DiscordHandler()
+
+
+@case("message.ignored")
+async def message_ignored() -> Case:
+    """
+    Message that is not addressed to the bot going through on_message.
+    """
+    on_message = fake_dc_handler().client.on_message
+    message = fake_message("anyone up for a game later tonight?")
+
+    async def run():
+        await on_message(message)
+
+    return run
+
+
+@case("message.routed_command")
+async def message_routed_command() -> Case:
+    """
+    'milo pause' going through on_message, the command queue, the local
+    router and a local reply. The user is not in a voice channel so nothing
+    is played.
+    """
+    dc_handler = fake_dc_handler()
+    on_message = dc_handler.client.on_message
+
+    async def run():
+        message = fake_message("milo pause")
+        await on_message(message)
+        await dc_handler.commands.join()
+
+    return run
+
+
+@case("call_function.resolve")
+def call_function_resolve() -> Case:
+    """
+    Resolving the tool chosen by the llm up to the coroutine that runs it.
+    """
+    from milo.handler.llm import LLMHandler
+    from milo.handler.msg import call_function
+
+    dc_handler = SimpleNamespace(client=SimpleNamespace(voice_clients=[]))
+    message = fake_message("milo play something")
+    llm_handler = LLMHandler()
+    tool_call = SimpleNamespace(
+        id="call_bench",
+        type="function",
+        function=SimpleNamespace(
+            name="audio_DiscordAudio_stream_audio",
+            arguments=json.dumps({"query": "something"}),
+        ),
+    )
+    chat_choice = SimpleNamespace(
+        finish_reason="tool_calls",
+        message=SimpleNamespace(content=None, tool_calls=[tool_call]),
+    )
+
+    def run():
+        coroutine = call_function(
+            dc_handler, message, chat_choice, llm_handler
+        )
+        coroutine.close()
+
+    return run
+
+
+def settings_obj():
+    from milo.mods.settings import Settings
+
+    return Settings(
+        None, fake_message("milo settings"), {"group": "server"}, None
+    )
+
+
+@case("settings.settings_current")
+def settings_current() -> Case:
+    settings = settings_obj()
+
+    def run():
+        settings.settings_current
+
+    return run
+
+
+@case("settings.fields_extra_data")
+def settings_fields_extra_data() -> Case:
+    settings = settings_obj()
+
+    def run():
+        settings.fields_extra_data
+
+    return run
+
+
+@case("ui.form_modal")
+async def form_modal() -> Case:
+    """
+    Building the settings form. Views need a running event loop.
+    """
+    from milo.helpers.discord.ui import FormModal
+
+    settings = settings_obj()
+
+    async def run():
+        FormModal(title="bench", class_obj=settings)
+
+    return run
+
+
+@case("llm.request_construction")
+def llm_request_construction() -> Case:
+    """
+    Everything LLMHandler does for a new conversation before the request is
+    sent.
+    """
+    from milo.handler.llm import LLMHandler
+    from milo.helpers.tool_registry import tool_registry
+
+    def run():
+        llm_handler = LLMHandler()
+        llm_handler.add_message_to_record("user", "play something by adele")
+        llm_handler.function_choice_cache_key
+        llm_handler.chat_record.messages
+        tool_registry.schemas
+
+    return run
+
+
+class FakeVoiceClient:
+    """
+    Voice client that only keeps track of its state.
+    """
+
+    def __init__(self, guild_id: int) -> None:
+        self.guild = SimpleNamespace(id=guild_id)
+        self.playing = False
+        self.connected = True
+
+    def is_playing(self) -> bool:
+        return self.playing
+
+    def is_paused(self) -> bool:
+        return False
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def disconnect(self) -> None:
+        self.connected = False
+
+
+voice_idle_clients = 500
+
+
+@case(f"voice.idle_disconnect_{voice_idle_clients}_clients")
+async def voice_idle_disconnect() -> Case:
+    """
+    Many voice clients connecting, playing a few times and being
+    disconnected for being idle. The timeout is 0 so only the work done per
+    client is measured.
+    """
+    from milo.handler.voice_idle import IdleDisconnect
+
+    async def run():
+        idle_disconnect = IdleDisconnect(0)
+        voice_clients = [
+            FakeVoiceClient(guild_id) for guild_id in range(voice_idle_clients)
+        ]
+        for voice_client in voice_clients:
+            idle_disconnect.idle(voice_client)
+            for _ in range(3):
+                voice_client.playing = True
+                idle_disconnect.busy(voice_client)
+                voice_client.playing = False
+                idle_disconnect.idle(voice_client)
+
+        while idle_disconnect.voice_clients or idle_disconnect.tasks:
+            await asyncio.sleep(0)
+
+    return run
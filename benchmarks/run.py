@@ -0,0 +1,167 @@
+"""
+Benchmarks for Milo's hot paths. Results are written as JSON and compared
+against a stored baseline. Exits with 1 if a case is slower than the baseline
+by more than the threshold.
+
+Usage:
+    python -m benchmarks.run --save-baseline
+    python -m benchmarks.run --threshold 0.2
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Callable, Optional
+
+default_baseline = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def measure(
+    loop: asyncio.AbstractEventLoop,
+    run: Callable,
+    min_time: float,
+    repeat: int,
+) -> dict:
+    """
+    Time run. The number of calls per round is increased until a round
+    takes at least min_time. The fastest round is used since it is the least
+    affected by noise.
+
+    Args:
+        loop: asyncio.AbstractEventLoop
+        run: Callable
+        min_time: float
+        repeat: int
+
+    Returns:
+        dict
+    """
+    is_async = inspect.iscoroutinefunction(run)
+
+    async def run_async(number: int) -> None:
+        for _ in range(number):
+            await run()
+
+    def run_round(number: int) -> float:
+        start = time.perf_counter()
+        if is_async:
+            loop.run_until_complete(run_async(number))
+        else:
+            for _ in range(number):
+                run()
+        return time.perf_counter() - start
+
+    number = 1
+    while True:
+        elapsed = run_round(number)
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    rounds = [run_round(number) / number for _ in range(repeat)]
+    return {
+        "calls_per_round": number,
+        "best": min(rounds),
+        "mean": statistics.fmean(rounds),
+        "stdev": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Find cases that are slower than the baseline by more than threshold.
+
+    Args:
+        results: dict
+        baseline: dict
+        threshold: float
+            0.2 means 20% slower.
+
+    Returns:
+        list[str]
+            Description of every regression.
+    """
+    regressions = list()
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["best"]
+        change = (result["best"] - before) / before if before else 0.0
+        result["change"] = change
+        if change > threshold:
+            regressions.append(
+                f"{name}: {before * 1e6:.1f}us -> "
+                f"{result['best'] * 1e6:.1f}us (+{change:.0%})"
+            )
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--filter", default="", help="only run matching cases")
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--baseline", default=default_baseline)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    from benchmarks.cases import cases, setup_storage
+
+    setup_storage()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    results = dict()
+    for name, setup in cases.items():
+        if args.filter not in name:
+            continue
+        run = setup()
+        if inspect.isawaitable(run):
+            run = loop.run_until_complete(run)
+        results[name] = measure(loop, run, args.min_time, args.repeat)
+        print(f"{name:45} {results[name]['best'] * 1e6:12.2f}us")
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    regressions = list()
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+    else:
+        print(f"No baseline at {args.baseline}. Use --save-baseline.")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+"""
+OpenAI-compatible stand-in server for load testing without using the real
+API. It supports chat completions (tool calls, text and streamed text) and
+streamed text-to-speech.
+
+Usage:
+    python -m loadtest.fake_openai --port 8081 --latency lognormal:-1.5,0.5
+
+Point Milo at it with:
+    OPENAI_BASE_URL=http://127.0.0.1:8081/v1
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from aiohttp import web
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Callable
+
+# words in the user message that select a tool. the first match wins
+tool_keywords = (
+    ("pause", "pause"),
+    ("resume", "resume"),
+    ("stop", "stop"),
+    ("say", "say_text"),
+    ("skip", "skip"),
+    ("clear", "clear_queue"),
+    ("queue", "list_queue"),
+    ("play", "stream_audio"),
+    ("setting", "get_settings_as_dict"),
+    ("schedule", "get_schedule"),
+)
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Parse a latency distribution.
+
+    Args:
+        spec: str
+            fixed:<s>, uniform:<min>,<max>, lognormal:<mu>,<sigma> or
+            normal:<mean>,<stddev>
+
+    Returns:
+        Callable[[], float]
+            Returns a latency in seconds every time it is called.
+    """
+    kind, _, values = spec.partition(":")
+    params = [float(v) for v in values.split(",") if v]
+
+    match kind:
+        case "fixed":
+            return lambda: params[0]
+        case "uniform":
+            return lambda: random.uniform(params[0], params[1])
+        case "lognormal":
+            return lambda: random.lognormvariate(params[0], params[1])
+        case "normal":
+            return lambda: max(0.0, random.gauss(params[0], params[1]))
+        case _:
+            raise ValueError(f"Latency distribution '{spec}' does not exist.")
+
+
+class FakeOpenAI:
+    """
+    Class for the fake API.
+
+    Attributes:
+        latency: Callable[[], float]
+            Time to the first byte of chat completions.
+        tts_latency: Callable[[], float]
+            Time to the first byte of speech.
+        token_delay: float
+            Delay between streamed chunks.
+        error_rate: float
+            Share of requests that fail with 500 to exercise retries.
+        tts_bytes: int
+        tts_chunk: int
+        requests: int
+    """
+
+    def __init__(
+        self,
+        latency: Callable[[], float],
+        tts_latency: Callable[[], float],
+        token_delay: float,
+        error_rate: float,
+        tts_bytes: int,
+        tts_chunk: int,
+    ) -> None:
+        self.latency = latency
+        self.tts_latency = tts_latency
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.tts_bytes = tts_bytes
+        self.tts_chunk = tts_chunk
+        self.requests: int = 0
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "x-ratelimit-remaining-requests": "10000",
+            "x-ratelimit-reset-requests": "1s",
+            "x-ratelimit-remaining-tokens": "1000000",
+            "x-ratelimit-reset-tokens": "1s",
+        }
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/v1/audio/speech", self.speech)
+        return app
+
+    async def failed(self) -> bool:
+        self.requests += 1
+        return random.random() < self.error_rate
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if await self.failed():
+            return web.json_response(
+                {"error": {"message": "fake error", "type": "server_error"}},
+                status=500,
+            )
+
+        await asyncio.sleep(self.latency())
+
+        user_message = ""
+        for message in reversed(body["messages"]):
+            if message.get("role") == "user":
+                user_message = message.get("content") or ""
+                break
+
+        if body.get("tools"):
+            tool_call = self.choose_tool(body["tools"], user_message)
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [tool_call],
+            }
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": "Done. All good."}
+            finish_reason = "stop"
+
+        if body.get("stream"):
+            return await self.stream_chat(request, body, message["content"])
+
+        return web.json_response(
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": message,
+                        "finish_reason": finish_reason,
+                        "logprobs": None,
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": len(json.dumps(body)) // 4,
+                    "completion_tokens": 20,
+                    "total_tokens": len(json.dumps(body)) // 4 + 20,
+                },
+            },
+            headers=self.headers,
+        )
+
+    def choose_tool(self, tools: list[dict], user_message: str) -> dict:
+        """
+        Choose tool by keyword and fill its arguments from the message.
+
+        Args:
+            tools: list[dict]
+            user_message: str
+
+        Returns:
+            dict
+        """
+        names = [tool["function"]["name"] for tool in tools]
+        words = user_message.lower().split()
+
+        chosen = next((n for n in names if n.endswith("_default")), names[0])
+        rest = user_message
+        for keyword, suffix in tool_keywords:
+            if any(word.startswith(keyword) for word in words):
+                match = [n for n in names if n.endswith(f"_{suffix}")]
+                if match:
+                    chosen = match[0]
+                    rest = user_message.lower().split(keyword, 1)[1].strip()
+                    break
+
+        tool = next(t for t in tools if t["function"]["name"] == chosen)
+        properties = tool["function"]["parameters"].get("properties", {})
+        arguments = dict()
+        for name, schema in properties.items():
+            if "enum" in schema:
+                arguments[name] = schema["enum"][0]
+            else:
+                arguments[name] = rest or "something"
+
+        return {
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {"name": chosen, "arguments": json.dumps(arguments)},
+        }
+
+    async def stream_chat(
+        self, request: web.Request, body: dict, content: str
+    ) -> web.StreamResponse:
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", **self.headers}
+        )
+        await response.prepare(request)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for word in (content or "").split(" "):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": f"{word} "},
+                        "finish_reason": None,
+                    }
+                ],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(self.token_delay)
+
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def speech(self, request: web.Request) -> web.StreamResponse:
+        await request.json()
+        if await self.failed():
+            return web.json_response(
+                {"error": {"message": "fake error", "type": "server_error"}},
+                status=500,
+            )
+
+        await asyncio.sleep(self.tts_latency())
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "audio/ogg", **self.headers}
+        )
+        await response.prepare(request)
+
+        sent = 0
+        while sent < self.tts_bytes:
+            size = min(self.tts_chunk, self.tts_bytes - sent)
+            await response.write(os.urandom(size))
+            sent += size
+            await asyncio.sleep(self.token_delay)
+
+        await response.write_eof()
+        return response
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="lognormal:-1.5,0.5")
+    parser.add_argument("--tts-latency", default="fixed:0.2")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tts-bytes", type=int, default=32 * 1024)
+    parser.add_argument("--tts-chunk", type=int, default=4096)
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(
+        latency=parse_latency(args.latency),
+        tts_latency=parse_latency(args.tts_latency),
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        tts_bytes=args.tts_bytes,
+        tts_chunk=args.tts_chunk,
+    )
+    web.run_app(fake.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+from __future__ import annotations
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Callable, Optional
+
+_ids = itertools.count(1_000_000)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int) -> None:
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.voice_client = None
+
+
+class FakeChannel:
+    def __init__(self, guild: FakeGuild) -> None:
+        self.id = next(_ids)
+        self.guild = guild
+
+    def __str__(self) -> str:
+        return f"general-{self.guild.id}"
+
+
+class FakeAuthor:
+    def __init__(
+        self,
+        name: str,
+        admin: bool = False,
+        voice_channel: Optional[FakeVoiceChannel] = None,
+    ) -> None:
+        self.id = next(_ids)
+        self.name = name
+        self.display_name = name
+        self.bot = False
+        self.voice = (
+            SimpleNamespace(channel=voice_channel) if voice_channel else None
+        )
+        self.guild_permissions = SimpleNamespace(administrator=admin)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeAudioSource:
+    """
+    Class that stands in for FFmpegOpusAudio so no FFmpeg is started.
+
+    Attributes:
+        source: Any
+            URL, path or a piped AudioStream.
+        pipe: bool
+    """
+
+    def __init__(self, source, *, pipe: bool = False, **kwargs) -> None:
+        self.source = source
+        self.pipe = pipe
+
+    @classmethod
+    async def probe(cls, source: str, **kwargs) -> tuple[str, int]:
+        return "opus", 128
+
+    def cleanup(self) -> None:
+        pass
+
+
+class FakeVoiceClient:
+    """
+    Class with the parts of discord.VoiceClient used by Milo. Playing runs
+    in a thread like discord.py's audio player: piped speech is read until
+    it ends and anything else plays for track_seconds.
+
+    Attributes:
+        track_seconds: float
+    """
+
+    def __init__(
+        self,
+        channel: FakeVoiceChannel,
+        on_disconnect: Callable[[], None],
+        track_seconds: float,
+    ) -> None:
+        self.channel = channel
+        self.guild = channel.guild
+        self.on_disconnect = on_disconnect
+        self.track_seconds = track_seconds
+        self.source: Optional[FakeAudioSource] = None
+        self.stopped = threading.Event()
+        self.resumed = threading.Event()
+        self.player: Optional[threading.Thread] = None
+        self.connected = True
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def is_playing(self) -> bool:
+        return self.player is not None and self.resumed.is_set()
+
+    def is_paused(self) -> bool:
+        return self.player is not None and not self.resumed.is_set()
+
+    def play(self, source: FakeAudioSource, after=None) -> None:
+        stopped = self.stopped = threading.Event()
+        resumed = self.resumed = threading.Event()
+        resumed.set()
+        self.source = source
+
+        def run() -> None:
+            if source.pipe:
+                while not stopped.is_set() and source.source.read(4096):
+                    resumed.wait()
+            else:
+                end = time.monotonic() + self.track_seconds
+                while not stopped.wait(max(0.0, end - time.monotonic())):
+                    if resumed.is_set():
+                        break
+                    # paused. the track ends later
+                    paused_at = time.monotonic()
+                    resumed.wait()
+                    end += time.monotonic() - paused_at
+            if self.player is threading.current_thread():
+                self.player = None
+            if after is not None:
+                after(None)
+
+        self.player = threading.Thread(target=run, daemon=True)
+        self.player.start()
+
+    def stop(self) -> None:
+        self.player = None
+        self.stopped.set()
+        self.resumed.set()
+
+    def pause(self) -> None:
+        self.resumed.clear()
+
+    def resume(self) -> None:
+        self.resumed.set()
+
+    async def disconnect(self, force: bool = False) -> None:
+        self.connected = False
+        self.stop()
+        self.on_disconnect()
+
+
+class FakeVoiceChannel:
+    """
+    Class for a voice channel that connects FakeVoiceClients and registers
+    them with the client, so they are found like real voice clients.
+    """
+
+    def __init__(
+        self, guild: FakeGuild, connection, track_seconds: float
+    ) -> None:
+        self.id = next(_ids)
+        self.guild = guild
+        self.connection = connection
+        self.track_seconds = track_seconds
+
+    async def connect(self, **kwargs) -> FakeVoiceClient:
+        voice_client = FakeVoiceClient(
+            self,
+            lambda: self.connection._remove_voice_client(self.guild.id),
+            self.track_seconds,
+        )
+        self.connection._add_voice_client(self.guild.id, voice_client)
+        self.guild.voice_client = voice_client
+        return voice_client
+
+
+def fake_extract_audio_info(latency: float) -> Callable[..., dict]:
+    """
+    Make a stand-in for DiscordAudio.extract_audio_info that takes latency
+    seconds, like yt-dlp, and returns a signed stream URL.
+
+    Args:
+        latency: float
+
+    Returns:
+        Callable[..., dict]
+    """
+
+    def extract_audio_info(self, query: str) -> dict:
+        time.sleep(latency)
+        video_id = abs(hash(query)) % 10**11
+        return {
+            "url": (
+                "https://rr1.googlevideo.com/videoplayback"
+                f"?expire={int(time.time()) + 6 * 3600}&id={video_id}"
+            ),
+            "title": query.title(),
+            "duration": 200.0,
+            "codec": "opus",
+            "id": f"youtube:{video_id}",
+        }
+
+    return extract_audio_info
+
+
+class FakeMessage:
+    """
+    Class with the parts of discord.Message used by Milo. Replies are
+    recorded instead of sent.
+
+    Attributes:
+        on_reply: Optional[Callable[[FakeMessage], None]]
+            Called with every reply.
+    """
+
+    def __init__(
+        self,
+        content: str,
+        author: FakeAuthor,
+        channel: FakeChannel,
+        reference: Optional[SimpleNamespace] = None,
+        on_reply: Optional[Callable[[FakeMessage], None]] = None,
+    ) -> None:
+        self.id = next(_ids)
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.reference = reference
+        self.mentions = []
+        self.on_reply = on_reply
+        self.replies: list[FakeMessage] = list()
+
+    async def reply(self, content: str = "", **kwargs) -> FakeMessage:
+        reply = FakeMessage(
+            content,
+            SimpleNamespace(id=0, name="milo", bot=True),
+            self.channel,
+            reference=SimpleNamespace(message_id=self.id),
+        )
+        self.replies.append(reply)
+        if self.on_reply:
+            self.on_reply(reply)
+        return reply
+
+    async def edit(self, content: str = "", **kwargs) -> FakeMessage:
+        self.content = content
+        return self
@@ -0,0 +1,326 @@
+"""
+End-to-end load generator for the message pipeline. Synthetic messages from
+N simulated guilds are sent through the same on_message handler the bot uses
+and the time until Milo replies is measured. Run it against the fake OpenAI
+server so no API quota is used.
+
+Usage:
+    python -m loadtest.fake_openai &
+    python -m loadtest.loadgen --guilds 50 --messages 20
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Optional
+
+default_mix = (
+    "milo play never gonna give you up",
+    "milo play bohemian rhapsody",
+    "milo pause",
+    "milo resume",
+    "milo skip",
+    "milo what's in the queue",
+    "milo clear the queue",
+    "milo stop",
+    "milo say good game everyone",
+    "milo show server settings",
+    "milo what can you do",
+    "milo what's the schedule",
+    "hello everyone",  # not addressed to the bot
+)
+# commands that only reply on errors, like speech, when the user is in voice
+silent = ("milo say",)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Args:
+        values: list[float]
+        p: float
+            0-100
+
+    Returns:
+        float
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values, default=0.0),
+    }
+
+
+async def monitor_loop_lag(
+    lags: list[float], stop: asyncio.Event, interval: float = 0.01
+) -> None:
+    """
+    Measure how late the event loop wakes up a sleeping task.
+
+    Args:
+        lags: list[float]
+        stop: asyncio.Event
+        interval: float
+    """
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - start - interval))
+
+
+def setup_storage() -> None:
+    """
+    Use a throwaway database and cache directory so load tests don't touch
+    real data.
+    """
+    from milo.handler.database import sqlitedb, tables
+    from milo.helpers.tts_cache import tts_cache
+    from milo.mods.settings import insert_default_settings_from_file
+
+    directory = tempfile.mkdtemp(prefix="milo-loadtest-")
+    tts_cache.directory = os.path.join(directory, "tts")
+
+    sqlitedb.init(
+        os.path.join(directory, "db.sqlite"), pragmas={"foreign_keys": 1}
+    )
+    sqlitedb.connect()
+    sqlitedb.create_tables(tables, safe=True)
+    insert_default_settings_from_file("server")
+
+
+def setup_voice(extraction_latency: float) -> None:
+    """
+    Replace FFmpeg and yt-dlp with fakes so voice commands run their whole
+    path (extraction pool, stream cache, queue, speech) without either.
+
+    Args:
+        extraction_latency: float
+            Seconds a fake extraction takes.
+    """
+    from loadtest.fakes import FakeAudioSource, fake_extract_audio_info
+    from milo.mods import audio
+
+    audio.FFmpegOpusAudio = FakeAudioSource
+    audio.DiscordAudio.extract_audio_info = fake_extract_audio_info(
+        extraction_latency
+    )
+
+
+async def run_guild(
+    dc_handler,
+    guild_id: int,
+    messages: int,
+    interval: float,
+    mix: tuple[str],
+    timeout: float,
+    latencies: list[float],
+    results: dict,
+    in_voice: bool,
+    track_seconds: float,
+) -> None:
+    """
+    Send messages from one simulated guild and record reply latency. If
+    in_voice is set, the author is in a voice channel so voice commands
+    connect, queue and play instead of failing right away.
+    """
+    from loadtest.fakes import (
+        FakeAuthor,
+        FakeChannel,
+        FakeGuild,
+        FakeMessage,
+        FakeVoiceChannel,
+    )
+
+    guild = FakeGuild(guild_id)
+    channel = FakeChannel(guild)
+    voice_channel = None
+    if in_voice:
+        voice_channel = FakeVoiceChannel(
+            guild, dc_handler.client._connection, track_seconds
+        )
+    author = FakeAuthor(
+        f"user-{guild_id}", admin=True, voice_channel=voice_channel
+    )
+    on_message = dc_handler.client.on_message
+
+    for _ in range(messages):
+        await asyncio.sleep(random.expovariate(1 / interval))
+
+        replied = asyncio.Event()
+        content = random.choice(mix)
+        message = FakeMessage(
+            content, author, channel, on_reply=lambda r: replied.set()
+        )
+
+        start = time.perf_counter()
+        try:
+            await on_message(message)
+        except Exception as e:
+            results["errors"] += 1
+            results["last_error"] = repr(e)
+            continue
+
+        if not content.lower().startswith("milo"):
+            results["ignored"] += 1
+            continue
+        if in_voice and content.lower().startswith(silent):
+            results["silent"] += 1
+            continue
+
+        try:
+            await asyncio.wait_for(replied.wait(), timeout)
+        except asyncio.TimeoutError:
+            results["timeouts"] += 1
+            continue
+
+        latencies.append(time.perf_counter() - start)
+        results["replied"] += 1
+
+
+async def run(
+    guilds: int,
+    messages: int,
+    interval: float,
+    timeout: float,
+    mix: tuple[str],
+    voice_share: float,
+    track_seconds: float,
+) -> dict:
+    from milo.handler.discord import DiscordHandler
+    from milo.handler.llm import get_client
+
+    # like the bot, the OpenAI client is created off the event loop
+    dc_handler = DiscordHandler(setup=get_client)
+    await dc_handler.run_setup()
+
+    latencies: list[float] = list()
+    lags: list[float] = list()
+    results = {
+        "replied": 0,
+        "ignored": 0,
+        "silent": 0,
+        "timeouts": 0,
+        "errors": 0,
+    }
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(lags, stop))
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            run_guild(
+                dc_handler,
+                guild_id,
+                messages,
+                interval,
+                mix,
+                timeout,
+                latencies,
+                results,
+                guild_id <= round(guilds * voice_share),
+                track_seconds,
+            )
+            for guild_id in range(1, guilds + 1)
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await lag_task
+
+    from milo.helpers.metrics import metrics
+
+    return {
+        "guilds": guilds,
+        "messages": guilds * messages,
+        "elapsed": elapsed,
+        "throughput": results["replied"] / elapsed if elapsed else 0.0,
+        "latency": summarize(latencies),
+        "loop_lag": summarize(lags),
+        **results,
+        "metrics": metrics.snapshot(),
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.5,
+        help="mean seconds between messages in a guild",
+    )
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument(
+        "--voice-share",
+        type=float,
+        default=0.5,
+        help="share of guilds whose user is in a voice channel",
+    )
+    parser.add_argument(
+        "--track-seconds",
+        type=float,
+        default=2,
+        help="how long a fake track plays",
+    )
+    parser.add_argument(
+        "--extraction-latency",
+        type=float,
+        default=0.3,
+        help="seconds a fake yt-dlp extraction takes",
+    )
+    parser.add_argument("--base-url", default="http://127.0.0.1:8081/v1")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    # must be set before the OpenAI client is created
+    os.environ["OPENAI_BASE_URL"] = args.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "loadtest")
+
+    setup_storage()
+    setup_voice(args.extraction_latency)
+    report = asyncio.run(
+        run(
+            args.guilds,
+            args.messages,
+            args.interval,
+            args.timeout,
+            default_mix,
+            args.voice_share,
+            args.track_seconds,
+        )
+    )
+
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
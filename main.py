@@ -1,23 +1,209 @@
 from __future__ import annotations
-from milo.handler.database import sqlitedb, tables
+
+# first so that the time spent importing everything else is measured
+from milo.helpers.startup import startup_timer
+
+import argparse
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+from typing import TYPE_CHECKING
+from milo.globals import app_logger
+from milo.handler.database import (
+    recreate_changed_cache_tables,
+    sqlitedb,
+    tables,
+)
 from milo.handler.discord import DiscordHandler
+from milo.handler.llm import get_client
 from milo.handler.log import Logger
+from milo.helpers.tool_registry import tool_registry
 from milo.mods.settings import insert_default_settings_from_file
 
+if TYPE_CHECKING:
+    from multiprocessing.process import BaseProcess
+    from typing import Callable, Optional
+
 Logger("discord")
 Logger("openai")
 Logger("peewee")
 
+restart_delay = 5
+
+
+def parse_shard_ids(value: str) -> list[int]:
+    """
+    Parse shard ids like '0-3' or '0,2,4'.
+
+    Args:
+        value: str
+
+    Returns:
+        list[int]
+    """
+    shard_ids = list()
+    for part in value.split(","):
+        start, _, end = part.partition("-")
+        shard_ids.extend(range(int(start), int(end or start) + 1))
+    return shard_ids
 
-def main() -> None:
 
-    sqlitedb.connect()
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    """
+    Split shards into contiguous ranges, one per process.
+
+    Args:
+        shard_count: int
+        processes: int
+
+    Returns:
+        list[list[int]]
+    """
+    processes = min(processes, shard_count)
+    size, extra = divmod(shard_count, processes)
+    ranges = list()
+    start = 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def setup_database() -> None:
+    sqlitedb.connect(reuse_if_open=True)
+    recreate_changed_cache_tables()
     sqlitedb.create_tables(tables, safe=True)
     insert_default_settings_from_file("server")
+    # connections are per thread and process. they reconnect when used
+    sqlitedb.close()
+
+
+def setup_shard() -> None:
+    setup_database()
+    # openai takes most of a second to import. not on the event loop
+    get_client()
+
 
-    dc_handler = DiscordHandler()
+def run_shards(
+    shard_ids: Optional[list[int]] = None,
+    shard_count: Optional[int] = None,
+    setup: Optional[Callable[[], None]] = None,
+) -> None:
+    """
+    Run the bot for some or all shards in this process.
+
+    Args:
+        shard_ids: Optional[list[int]]
+        shard_count: Optional[int]
+        setup: Optional[Callable[[], None]]
+            Runs while logging in.
+    """
+    # shard processes start here
+    startup_timer.end("imports")
+
+    dc_handler = DiscordHandler(shard_ids, shard_count, setup)
     dc_handler.run()
 
 
+def launch(shard_count: int, processes: int) -> None:
+    """
+    Run shard ranges in separate processes and restart processes that exit
+    with an error.
+
+    Args:
+        shard_count: int
+        processes: int
+    """
+    context = multiprocessing.get_context("spawn")
+
+    def start(shard_ids: list[int]) -> BaseProcess:
+        process = context.Process(
+            target=run_shards,
+            args=(shard_ids, shard_count, get_client),
+            name=f"milo-shards-{shard_ids[0]}-{shard_ids[-1]}",
+        )
+        process.start()
+        app_logger.info(f"Started {process.name} (pid {process.pid}).")
+        return process
+
+    running = {
+        tuple(shard_ids): start(shard_ids)
+        for shard_ids in split_shards(shard_count, processes)
+    }
+
+    try:
+        while running:
+            wait([process.sentinel for process in running.values()])
+            for shard_ids, process in list(running.items()):
+                if process.is_alive():
+                    continue
+
+                del running[shard_ids]
+                if process.exitcode == 0:
+                    app_logger.info(f"{process.name} exited.")
+                    continue
+
+                app_logger.error(
+                    f"{process.name} exited with {process.exitcode}. "
+                    f"Restarting in {restart_delay}s."
+                )
+                time.sleep(restart_delay)
+                running[shard_ids] = start(list(shard_ids))
+    except KeyboardInterrupt:
+        for process in running.values():
+            process.terminate()
+        for process in running.values():
+            process.join()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run Milo.")
+    parser.add_argument(
+        "--shard-count",
+        type=int,
+        help="total shards over all processes. Discord chooses if not set",
+    )
+    parser.add_argument(
+        "--shard-ids",
+        type=parse_shard_ids,
+        help="shards to run in this process, like '0-3' or '0,2,4'",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="split --shard-count shards over this many processes",
+    )
+    parser.add_argument(
+        "--eager-start",
+        action="store_true",
+        help="set up the database, import all mods and create the OpenAI "
+        "client before logging in",
+    )
+    args = parser.parse_args(argv)
+
+    if args.shard_ids and not args.shard_count:
+        parser.error("--shard-ids needs --shard-count")
+    if args.processes > 1 and not args.shard_count:
+        parser.error("--processes needs --shard-count")
+    if args.processes > 1 and args.shard_ids:
+        parser.error("--processes and --shard-ids can't be used together")
+
+    if args.processes > 1:
+        # set up once for all processes
+        setup_database()
+        launch(args.shard_count, args.processes)
+    elif args.eager_start:
+        setup_database()
+        tool_registry.build()
+        get_client()
+        run_shards(args.shard_ids, args.shard_count)
+    else:
+        # the database and the OpenAI client are set up while logging in.
+        # mods are imported when the client is ready
+        run_shards(args.shard_ids, args.shard_count, setup_shard)
+
+
 if __name__ == "__main__":
     main()
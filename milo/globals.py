@@ -4,6 +4,8 @@ app_logger = Logger("milo").get_logger()
 
 bot_name = "milo"
 bot_name_len = len(bot_name)
+# guild id: wake word used instead of bot_name in that guild
+wake_words: dict[int, str] = dict()
 bot_server_id = 0
 
 parent_mod = "milo.mods"
@@ -11,3 +13,75 @@ timeout_wait_for_reply = 10
 timeout_wait_for_button_interaction = 5
 voice_client_disconnect_time = 60
 voice_client_tts_max_chars = 200
+# tracks waiting to be played per guild
+track_queue_max_length = 100
+
+# shared OpenAI client connection pool
+llm_max_connections = 100
+llm_max_keepalive_connections = 20
+llm_keepalive_expiry = 30
+llm_connect_timeout = 5
+llm_request_timeout = 60
+
+metrics_report_interval = 300
+
+# cache for tool selection of single-turn conversations
+llm_cache_max_entries = 512
+llm_cache_ttl = 600
+
+# stream llm replies by editing the discord message as text arrives
+llm_stream_responses = False
+stream_edit_interval = 1.0
+discord_message_max_chars = 2000
+
+# budget for the chat record sent to the llm
+llm_chat_record_max_chars = 6000
+llm_tool_result_max_chars = 1500
+
+# cache for text-to-speech audio
+tts_cache_dir = "data/cache/tts"
+tts_cache_max_bytes = 256 * 1024 * 1024
+# seconds between scans for files written by other shard processes
+tts_cache_rescan_interval = 300
+
+# scheduling of requests to the OpenAI API
+llm_concurrency = {"chat": 16, "audio": 4}
+llm_max_retries = 3
+llm_retry_base_delay = 0.5
+llm_retry_max_delay = 8
+
+# how long a caller waits for a call shared with identical requests
+llm_singleflight_timeout = 120
+audio_extraction_timeout = 30
+
+# threads for yt-dlp. extractions past this wait in a queue
+audio_extraction_workers = 4
+# yt-dlp's instances are recreated when the file is changed by something
+# else. cookies refreshed by YouTube are saved at most every interval
+ydl_cookie_file = "./data/system/youtube_cookies.txt"
+ydl_cookie_save_interval = 300
+
+# cache for resolved streams. signed stream URLs expire so a stream is only
+# used while its URL stays valid for at least stream_cache_expiry_margin or
+# the length of the song, whichever is longer
+stream_cache_max_entries = 1024
+stream_cache_query_ttl = 24 * 3600
+stream_cache_default_ttl = 3600
+stream_cache_expiry_margin = 300
+stream_cache_persist = True
+
+# queues for commands addressed to the bot
+command_workers = 16
+command_guild_workers = 2
+command_queue_max_depth = 10
+
+# how often shard state and cache memory are logged
+health_report_interval = 60
+
+# what discord.py keeps in memory. milo only reads the author of a message,
+# their permissions and their voice state. the first two come with the
+# message and voice states are cached whatever the member cache is set to
+members_intent = False
+member_cache = "none"  # "all", "voice", "joined" or "none"
+chunk_guilds_at_startup = False
+max_messages = None  # None turns the message cache off. discord.py uses 1000
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import json
+from typing import TYPE_CHECKING
+from milo.globals import (
+    llm_chat_record_max_chars,
+    llm_tool_result_max_chars,
+)
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessage
+    from typing import Union
+
+compacted_tool_result = '{"response":"[compacted]"}'
+
+
+class ChatRecord:
+    """
+    Class to hold the chat with the llm within a character budget. The system
+    prompt is always kept. When the budget is exceeded, results of older tool
+    calls are compacted first and then the oldest messages are dropped until
+    the record fits again. The latest message is never dropped.
+
+    Attributes:
+        system_message: dict
+        history: list[dict]
+            Every message after the system prompt.
+        max_chars: int
+        tool_result_max_chars: int
+        chars: int
+            Current size of history.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        max_chars: int = llm_chat_record_max_chars,
+        tool_result_max_chars: int = llm_tool_result_max_chars,
+    ) -> None:
+        self.system_message: dict = {
+            "role": "system",
+            "content": system_prompt,
+        }
+        self.history: list[dict] = list()
+        self.max_chars = max_chars
+        self.tool_result_max_chars = tool_result_max_chars
+        self.chars: int = 0
+
+    def __len__(self) -> int:
+        return len(self.history) + 1
+
+    @property
+    def messages(self) -> list[dict]:
+        """
+        Messages to send to the llm.
+
+        Returns:
+            list[dict]
+        """
+        metrics.observe("llm.chat_record.chars", self.chars)
+        return [self.system_message, *self.history]
+
+    def add_message(self, role: str, content: str) -> None:
+        """
+        Args:
+            role: str
+            content: str
+        """
+        self.append({"role": role, "content": content})
+
+    def add_tool_call(
+        self,
+        message: ChatCompletionMessage,
+        results: Union[str, dict, None],
+    ) -> None:
+        """
+        Add the message where the llm chose a function and the results of that
+        function. Only the fields needed for the next request are kept and the
+        results are stored as compact JSON.
+
+        Args:
+            message: ChatCompletionMessage
+            results: Union[str, dict, None]
+        """
+        tool_calls = [
+            {
+                "id": tool_call.id,
+                "type": tool_call.type,
+                "function": {
+                    "name": tool_call.function.name,
+                    "arguments": tool_call.function.arguments,
+                },
+            }
+            for tool_call in message.tool_calls
+        ]
+        self.append(
+            {
+                "role": "assistant",
+                "content": message.content,
+                "tool_calls": tool_calls,
+            }
+        )
+
+        content = json.dumps(
+            {"response": results}, separators=(",", ":"), default=str
+        )
+        if len(content) > self.tool_result_max_chars:
+            content = content[: self.tool_result_max_chars] + "...[truncated]"
+            metrics.incr("llm.chat_record.truncated")
+
+        self.append(
+            {
+                "role": "tool",
+                "content": content,
+                "tool_call_id": tool_calls[0]["id"],
+            }
+        )
+
+    def append(self, message: dict) -> None:
+        """
+        Add message and compact the record if it is over budget.
+
+        Args:
+            message: dict
+        """
+        self.history.append(message)
+        self.chars += self.size_of(message)
+        if self.chars > self.max_chars:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Compact older tool results and then drop the oldest messages until
+        the record is within budget.
+        """
+        # the last message is the one being responded to. keep it as is
+        for message in self.history[:-1]:
+            if self.chars <= self.max_chars:
+                return
+            if (
+                message["role"] == "tool"
+                and message["content"] != compacted_tool_result
+            ):
+                self.chars -= self.size_of(message)
+                message["content"] = compacted_tool_result
+                self.chars += self.size_of(message)
+                metrics.incr("llm.chat_record.compacted")
+
+        # never drop the group that holds the last message
+        while self.chars > self.max_chars and self.oldest_group_end() < len(
+            self.history
+        ):
+            self.drop_oldest()
+
+    def oldest_group_end(self) -> int:
+        """
+        Index after the oldest message and the tool results that follow it.
+
+        Returns:
+            int
+        """
+        end = 1
+        while end < len(self.history) and self.history[end]["role"] == "tool":
+            end += 1
+        return end
+
+    def drop_oldest(self) -> None:
+        """
+        Drop the oldest message. Tool results are dropped together with the
+        message that called the tool, since the API rejects tool messages
+        without it.
+        """
+        end = self.oldest_group_end()
+        for message in self.history[:end]:
+            self.chars -= self.size_of(message)
+            metrics.incr("llm.chat_record.dropped")
+        del self.history[:end]
+
+    @staticmethod
+    def size_of(message: dict) -> int:
+        """
+        Approximate size of message in characters.
+
+        Args:
+            message: dict
+
+        Returns:
+            int
+        """
+        size = len(message.get("content") or "")
+        for tool_call in message.get("tool_calls", ()):
+            size += len(tool_call["function"]["name"])
+            size += len(tool_call["function"]["arguments"])
+        return size
@@ -0,0 +1,151 @@
+from __future__ import annotations
+import time
+from asyncio import Event, create_task
+from collections import deque
+from typing import TYPE_CHECKING
+from milo.globals import app_logger
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from asyncio import Task
+    from typing import Awaitable, Callable, Hashable
+
+    Command = Callable[[], Awaitable[None]]
+
+
+class CommandQueue:
+    """
+    Class to run commands addressed to the bot with bounded concurrency.
+    Each guild has its own FIFO queue and guilds take turns for free workers
+    so a busy guild cannot starve the others.
+
+    Attributes:
+        workers: int
+            Maximum commands running at the same time over all guilds.
+        guild_workers: int
+            Maximum commands running at the same time in one guild.
+        max_depth: int
+            Maximum commands waiting in one guild.
+        queues: dict[Hashable, deque]
+            guild id: deque of (command, time queued)
+        running: dict[Hashable, int]
+            guild id: commands running
+        ready: deque[Hashable]
+            Guilds that have commands waiting and a free guild worker, in
+            the order they get the next free worker.
+        active: int
+        tasks: set[Task]
+        idle: Event
+            Set when nothing is queued or running.
+    """
+
+    def __init__(
+        self, workers: int, guild_workers: int, max_depth: int
+    ) -> None:
+        self.workers = workers
+        self.guild_workers = guild_workers
+        self.max_depth = max_depth
+        self.queues: dict[Hashable, deque] = dict()
+        self.running: dict[Hashable, int] = dict()
+        self.ready: deque[Hashable] = deque()
+        self.active: int = 0
+        self.tasks: set[Task] = set()
+        self.idle = Event()
+        self.idle.set()
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def submit(self, guild_id: Hashable, command: Command) -> bool:
+        """
+        Queue command to run once there is a free worker.
+
+        Args:
+            guild_id: Hashable
+            command: Command
+
+        Returns:
+            bool
+                False if the guild's queue is full and the command was
+                dropped.
+        """
+        queue = self.queues.get(guild_id)
+        if queue is None:
+            queue = self.queues[guild_id] = deque()
+            self.running[guild_id] = 0
+
+        if len(queue) >= self.max_depth:
+            metrics.incr("command_queue.rejected")
+            return False
+
+        queue.append((command, time.perf_counter()))
+        if len(queue) == 1 and self.running[guild_id] < self.guild_workers:
+            self.ready.append(guild_id)
+
+        self.idle.clear()
+        metrics.incr("command_queue.submitted")
+        self.dispatch()
+        return True
+
+    def dispatch(self) -> None:
+        """
+        Start queued commands while there are free workers, one guild at a
+        time.
+        """
+        while self.ready and self.active < self.workers:
+            guild_id = self.ready.popleft()
+            queue = self.queues[guild_id]
+            command, queued_at = queue.popleft()
+
+            self.active += 1
+            self.running[guild_id] += 1
+            # back of the line for the guild's next command
+            if queue and self.running[guild_id] < self.guild_workers:
+                self.ready.append(guild_id)
+
+            metrics.observe(
+                "command_queue.wait", time.perf_counter() - queued_at
+            )
+            task = create_task(self.run(guild_id, command))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        metrics.set_gauge("command_queue.active", self.active)
+        metrics.set_gauge("command_queue.depth", self.depth)
+
+    async def run(self, guild_id: Hashable, command: Command) -> None:
+        try:
+            await command()
+        except Exception as e:
+            app_logger.error(e)
+        finally:
+            self.release(guild_id)
+
+    def release(self, guild_id: Hashable) -> None:
+        """
+        Free the worker of a finished command.
+
+        Args:
+            guild_id: Hashable
+        """
+        self.active -= 1
+        self.running[guild_id] -= 1
+        queue = self.queues[guild_id]
+
+        # the guild was not in ready while all of its workers were busy
+        if queue and self.running[guild_id] == self.guild_workers - 1:
+            self.ready.append(guild_id)
+        elif not queue and not self.running[guild_id]:
+            del self.queues[guild_id]
+            del self.running[guild_id]
+
+        self.dispatch()
+        if not self.active and not self.ready:
+            self.idle.set()
+
+    async def join(self) -> None:
+        """
+        Wait until every queued command has finished.
+        """
+        await self.idle.wait()
@@ -0,0 +1,139 @@
+from __future__ import annotations
+from asyncio import create_task, get_running_loop, sleep
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+from milo.globals import app_logger
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from asyncio import Task
+    from discord import Message
+    from typing import Optional
+    from milo.handler.llm import LLMHandler
+
+
+class Conversation:
+    """
+    Class for a chat with the bot that is waiting for the user to reply to
+    the bot's question.
+
+    Attributes:
+        message: Message
+            Message the bot asked its question in reply to.
+        prompt: Message
+            The bot's question.
+        llm_handler: LLMHandler
+        expires_at: float
+            Event loop time after which replies are ignored.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        prompt: Message,
+        llm_handler: LLMHandler,
+        expires_at: float,
+    ) -> None:
+        self.message = message
+        self.prompt = prompt
+        self.llm_handler = llm_handler
+        self.expires_at = expires_at
+
+
+class ConversationRouter:
+    """
+    Class to route replies to the conversation they continue. Conversations
+    are keyed by the id of the bot's question so finding the conversation for
+    a message is a single lookup, no matter how many are open.
+
+    Every conversation has the same timeout so the order they are opened in
+    is also the order they expire in. One timer task expires them in that
+    order and only runs while conversations are open.
+
+    Attributes:
+        timeout: float
+        conversations: OrderedDict[int, Conversation]
+            prompt message id: Conversation
+        expiry_task: Optional[Task]
+    """
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self.conversations: OrderedDict[int, Conversation] = OrderedDict()
+        self.expiry_task: Optional[Task] = None
+
+    def __len__(self) -> int:
+        return len(self.conversations)
+
+    def open(
+        self, message: Message, prompt: Message, llm_handler: LLMHandler
+    ) -> None:
+        """
+        Wait for a reply to the bot's question.
+
+        Args:
+            message: Message
+            prompt: Message
+            llm_handler: LLMHandler
+        """
+        expires_at = get_running_loop().time() + self.timeout
+        self.conversations[prompt.id] = Conversation(
+            message, prompt, llm_handler, expires_at
+        )
+        metrics.incr("conversations.opened")
+        metrics.set_gauge("conversations.open", len(self.conversations))
+
+        if self.expiry_task is None or self.expiry_task.done():
+            self.expiry_task = create_task(self.expire())
+
+    def resume(self, message: Message) -> Optional[Conversation]:
+        """
+        Get the conversation the message is a reply to. It is closed since
+        the bot either asks a new question or finishes.
+
+        Args:
+            message: Message
+
+        Returns:
+            Optional[Conversation]
+        """
+        if message.reference is None or not self.conversations:
+            return None
+
+        conversation = self.conversations.pop(
+            message.reference.message_id, None
+        )
+        if conversation is None:
+            return None
+
+        metrics.set_gauge("conversations.open", len(self.conversations))
+        if conversation.expires_at <= get_running_loop().time():
+            # the timer has not caught up yet; treat it as expired
+            create_task(self.timed_out(conversation))
+            return None
+
+        metrics.incr("conversations.resumed")
+        return conversation
+
+    async def expire(self) -> None:
+        """
+        Close conversations once they time out, oldest first.
+        """
+        loop = get_running_loop()
+        while self.conversations:
+            prompt_id, conversation = next(iter(self.conversations.items()))
+            delay = conversation.expires_at - loop.time()
+            if delay > 0:
+                await sleep(delay)
+                continue
+
+            del self.conversations[prompt_id]
+            metrics.set_gauge("conversations.open", len(self.conversations))
+            await self.timed_out(conversation)
+
+    async def timed_out(self, conversation: Conversation) -> None:
+        metrics.incr("conversations.expired")
+        try:
+            await conversation.message.reply("Ignoring. Took too long.")
+        except Exception as e:
+            app_logger.error(e)
@@ -1,14 +1,21 @@
 from peewee import (
     CharField,
     DateTimeField,
+    FloatField,
     ForeignKeyField,
     IntegerField,
     Model,
     SqliteDatabase,
     TextField,
 )
+from milo.globals import app_logger
 
-sqlitedb = SqliteDatabase("data/db/db.sqlite3", pragmas={"foreign_keys": 1})
+# WAL lets shard processes read while another one writes
+sqlitedb = SqliteDatabase(
+    "data/db/db.sqlite3",
+    pragmas={"foreign_keys": 1, "journal_mode": "wal"},
+    timeout=10,
+)
 
 
 class BaseModel(Model):
@@ -105,6 +112,27 @@ class Person(BaseModel):
         table_name = "person"
 
 
+class StreamQuery(BaseModel):
+    query = CharField(primary_key=True)
+    stream_id = CharField()
+    expires_at = FloatField()
+
+    class Meta:
+        table_name = "stream_query"
+
+
+class StreamInfo(BaseModel):
+    stream_id = CharField(primary_key=True)
+    title = CharField()
+    url = TextField()
+    duration = FloatField(null=True)
+    codec = CharField(null=True)
+    expires_at = FloatField(index=True)
+
+    class Meta:
+        table_name = "stream_info"
+
+
 tables = [
     SettingsServer,
     Session,
@@ -114,4 +142,26 @@ tables = [
     GameMatch,
     GamePlatform,
     Person,
+    StreamQuery,
+    StreamInfo,
 ]
+
+# hold only cached data, so they are recreated when their columns change
+cache_tables = [StreamQuery, StreamInfo]
+
+
+def recreate_changed_cache_tables() -> None:
+    """
+    Drop cache tables whose columns differ from their model so that
+    create_tables creates them again. create_tables doesn't change existing
+    tables.
+    """
+    for model in cache_tables:
+        table_name = model._meta.table_name
+        if not sqlitedb.table_exists(table_name):
+            continue
+
+        columns = {column.name for column in sqlitedb.get_columns(table_name)}
+        if columns != set(model._meta.columns):
+            app_logger.info(f"Recreating {table_name}, its columns changed.")
+            model.drop_table()
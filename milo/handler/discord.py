@@ -1,37 +1,109 @@
 from __future__ import annotations
+import asyncio
 import os
-from asyncio import sleep
-from discord import Client, Intents
+from asyncio import Event, create_task, sleep, to_thread
+from collections import Counter
+from discord import AutoShardedClient, Intents, MemberCacheFlags, utils
 from dotenv import load_dotenv
 from typing import TYPE_CHECKING
-from milo.globals import app_logger, voice_client_disconnect_time
+from milo.globals import (
+    app_logger,
+    bot_name,
+    chunk_guilds_at_startup,
+    command_guild_workers,
+    command_queue_max_depth,
+    command_workers,
+    health_report_interval,
+    max_messages,
+    member_cache,
+    members_intent,
+    metrics_report_interval,
+    timeout_wait_for_reply,
+    wake_words,
+)
+from milo.handler.command_queue import CommandQueue
+from milo.handler.conversation import ConversationRouter
+from milo.handler.message_filter import MessageFilter
 from milo.handler.msg import process_message
+from milo.handler.track_queue import track_queue
+from milo.handler.voice_idle import idle_disconnect
+from milo.helpers.discord.cpu import cpu_monitor
+from milo.helpers.discord.memory import cache_memory_report
+from milo.helpers.metrics import metrics
+from milo.helpers.startup import startup_timer
+from milo.helpers.tool_registry import tool_registry
 
 if TYPE_CHECKING:
+    from asyncio import Task
     from discord import Guild, Member, Message, VoiceState
-    from typing import Final
+    from typing import Callable, Final, Optional
 
 
 class DiscordHandler:
     """
-    Class to handle discord client initialisation.
+    Class to handle discord client initialisation. The client is sharded;
+    by default it runs every shard Discord recommends. A process can run
+    some of the shards by passing shard_ids and shard_count.
+
+    Guilds always belong to the same shard so state kept per guild, like
+    conversations, command queues and voice idle deadlines, stays in the
+    process that runs the shard.
 
     Attributes:
         token: Final[str]
         intents: Intents
         members: bool
         guilds: bool
-        client: Client
+        client: AutoShardedClient
         token: str
         message_content: bool
+        metrics_task: Optional[Task]
+        health_task: Optional[Task]
+        conversations: ConversationRouter
+            Conversations waiting for the user to reply to the bot.
+        message_filter: MessageFilter
+        commands: CommandQueue
+            Runs messages addressed to the bot.
+        setup: Optional[Callable[[], None]]
+            Blocking setup, like creating database tables, that runs in a
+            thread while the client logs in and connects.
+        setup_done: Event
+            Messages wait for it before they are processed.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        shard_ids: Optional[list[int]] = None,
+        shard_count: Optional[int] = None,
+        setup: Optional[Callable[[], None]] = None,
+    ) -> None:
         self.token: Final[str] = ""
         self.intents: Intents = Intents.default()
-        self.intents.members: bool = True
+        self.intents.members: bool = members_intent
         self.intents.guilds: bool = True
-        self.client: Client = Client(intents=self.intents)
+        self.client: AutoShardedClient = AutoShardedClient(
+            intents=self.intents,
+            shard_ids=shard_ids,
+            shard_count=shard_count,
+            member_cache_flags=self.member_cache_flags,
+            chunk_guilds_at_startup=chunk_guilds_at_startup,
+            max_messages=max_messages,
+        )
+        self.metrics_task: Optional[Task] = None
+        self.health_task: Optional[Task] = None
+        self.conversations: ConversationRouter = ConversationRouter(
+            timeout_wait_for_reply
+        )
+        self.message_filter: MessageFilter = MessageFilter(
+            bot_name, wake_words
+        )
+        self.commands: CommandQueue = CommandQueue(
+            command_workers, command_guild_workers, command_queue_max_depth
+        )
+        self.setup = setup
+        self.setup_done: Event = Event()
+        if setup is None:
+            self.setup_done.set()
 
         load_dotenv()
         self.token: str = os.getenv("DISCORD_TOKEN")
@@ -45,6 +117,42 @@ class DiscordHandler:
         @self.client.event
         async def on_ready() -> None:
             app_logger.info(f"{self.client.user} is now running!")
+            self.message_filter.set_bot_id(self.client.user.id)
+
+            if not startup_timer.reported:
+                startup_timer.end("gateway")
+                # import the mods now instead of on the first message
+                startup_timer.start("tool_registry")
+                tool_registry.build()
+                startup_timer.end("tool_registry")
+                startup_timer.report()
+
+            # on_ready can run again after reconnecting
+            if self.metrics_task is None:
+                self.metrics_task = create_task(
+                    metrics.report_periodically(metrics_report_interval)
+                )
+            if self.health_task is None:
+                self.health_task = create_task(
+                    self.report_health(health_report_interval)
+                )
+
+        @self.client.event
+        async def on_shard_ready(shard_id: int) -> None:
+            app_logger.info(f"Shard {shard_id} is ready.")
+
+        @self.client.event
+        async def on_shard_connect(shard_id: int) -> None:
+            metrics.incr(f"shard.{shard_id}.connects")
+
+        @self.client.event
+        async def on_shard_disconnect(shard_id: int) -> None:
+            app_logger.warning(f"Shard {shard_id} disconnected.")
+            metrics.incr(f"shard.{shard_id}.disconnects")
+
+        @self.client.event
+        async def on_shard_resumed(shard_id: int) -> None:
+            app_logger.info(f"Shard {shard_id} resumed.")
 
         @self.client.event
         async def on_message(message: Message) -> None:
@@ -53,7 +161,34 @@ class DiscordHandler:
             if message.author == self.client.user:
                 return
 
-            await process_message(self, message)
+            # continue the conversation if it is a reply to the bot's question
+            conversation = self.conversations.resume(message)
+            prefix_end = self.message_filter.prefix_end(message)
+            if conversation:
+                llm_handler = conversation.llm_handler
+                prefix_end = prefix_end or 0
+
+            # ignore messages that are not addressed to the bot
+            elif prefix_end is None:
+                metrics.incr("messages.filtered")
+                return
+
+            else:
+                llm_handler = None
+
+            metrics.incr("messages.processed")
+            if not self.setup_done.is_set():
+                await self.setup_done.wait()
+
+            guild_id = message.guild.id if message.guild else None
+            queued = self.commands.submit(
+                guild_id,
+                lambda: process_message(
+                    self, message, llm_handler, prefix_end
+                ),
+            )
+            if not queued:
+                await message.reply("I'm busy right now. Try again soon.")
 
         @self.client.event
         async def on_voice_state_update(
@@ -64,25 +199,148 @@ class DiscordHandler:
             if not member == self.client.user:
                 return
 
+            # the voice client is disconnected if it is not used for
+            # voice_client_disconnect_time
             elif before.channel is None:
-                voice_client = after.channel.guild.voice_client
-                time = 0
-                while True:
-                    # disconnect from voice client after
-                    # voice_client_disconnect_time runs out
-                    # if it is not being used
-                    await sleep(1)
-                    time = time + 1
-                    if (
-                        voice_client.is_playing()
-                        and not voice_client.is_paused()
-                    ):
-                        time = 0
-                    if time == voice_client_disconnect_time:
-                        await voice_client.disconnect()
-                    if not voice_client.is_connected():
-                        break
+                idle_disconnect.idle(after.channel.guild.voice_client)
+
+            elif after.channel is None:
+                idle_disconnect.forget(before.channel.guild.id)
+                track_queue.forget(before.channel.guild.id)
+
+    @property
+    def member_cache_flags(self) -> MemberCacheFlags:
+        """
+        Members to cache according to member_cache.
+
+        Raises:
+            ValueError:
+
+        Returns:
+            MemberCacheFlags
+        """
+        match member_cache:
+            case "all":
+                return MemberCacheFlags.from_intents(self.intents)
+            case "voice":
+                return MemberCacheFlags(voice=True, joined=False)
+            case "joined":
+                return MemberCacheFlags(voice=False, joined=True)
+            case "none":
+                return MemberCacheFlags.none()
+            case _:
+                raise ValueError(
+                    f"Member cache '{member_cache}' does not exist."
+                )
+
+    def log_shard_health(self) -> None:
+        """
+        Log and record the state, latency and guild count of every shard run
+        by this process.
+        """
+        guilds = Counter(guild.shard_id for guild in self.client.guilds)
+        for shard_id, shard in sorted(self.client.shards.items()):
+            up = not shard.is_closed()
+            latency = shard.latency
+            metrics.set_gauge(f"shard.{shard_id}.up", int(up))
+            metrics.set_gauge(f"shard.{shard_id}.latency", latency)
+            metrics.set_gauge(f"shard.{shard_id}.guilds", guilds[shard_id])
+            app_logger.info(
+                f"shard={shard_id}/{shard.shard_count} up={up} "
+                f"latency={latency * 1000:.0f}ms "
+                f"ratelimited={shard.is_ws_ratelimited()} "
+                f"guilds={guilds[shard_id]}"
+            )
+
+    def log_cache_memory(self) -> None:
+        """
+        Log and record the size of discord.py's caches and of the process.
+        """
+        report = cache_memory_report(self.client)
+        for name, cache in report.items():
+            metrics.set_gauge(f"cache.{name}.count", cache["count"])
+            metrics.set_gauge(f"cache.{name}.bytes", cache["bytes"])
+        app_logger.info(
+            "cache memory: "
+            + ", ".join(
+                f"{name}={cache['count']} ({cache['bytes'] / 1024:.0f}KiB)"
+                for name, cache in report.items()
+            )
+        )
+
+    def log_stream_cpu(self) -> None:
+        """
+        Log and record the CPU used by the process and per voice stream, to
+        size hosts by the number of concurrent streams.
+        """
+        report = cpu_monitor.report(self.client)
+        if report["process"] is None:
+            return
+
+        streams = report["streams"]
+        ffmpeg = sum(streams)
+        # the process's share covers discord.py sending every stream
+        per_stream = (
+            (report["process"] + ffmpeg) / len(streams) if streams else 0.0
+        )
+        metrics.set_gauge("cpu.process", report["process"])
+        metrics.set_gauge("cpu.streams", len(streams))
+        metrics.set_gauge("cpu.ffmpeg", ffmpeg)
+        metrics.set_gauge("cpu.per_stream", per_stream)
+        app_logger.info(
+            f"cpu: process={report['process']:.1f}% "
+            f"streams={len(streams)} ffmpeg={ffmpeg:.1f}% "
+            f"per_stream={per_stream:.1f}%"
+        )
+
+    async def report_health(self, interval: float) -> None:
+        """
+        Log shard health, cache memory and CPU every interval seconds.
+
+        Args:
+            interval: float
+        """
+        while True:
+            self.log_shard_health()
+            self.log_cache_memory()
+            self.log_stream_cpu()
+            await sleep(interval)
+
+    async def run_setup(self) -> None:
+        startup_timer.start("setup")
+        try:
+            await to_thread(self.setup)
+        except Exception:
+            await self.client.close()
+            raise
+        startup_timer.end("setup")
+        self.setup_done.set()
+
+    async def start(self) -> None:
+        """
+        Log in and connect while setup runs.
+        """
+        async with self.client:
+            setup_task = None
+            if self.setup is not None:
+                setup_task = create_task(self.run_setup())
+
+            startup_timer.start("login")
+            await self.client.login(self.token)
+            startup_timer.end("login")
+
+            startup_timer.start("gateway")
+            await self.client.connect()
+
+        # raise the error if the client was closed because setup failed
+        if setup_task is not None and setup_task.done():
+            setup_task.result()
 
     def run(self) -> None:
         self.intents.message_content: bool = True
-        self.client.run(token=self.token)
+        # same logging as Client.run
+        utils.setup_logging(root=False)
+        try:
+            asyncio.run(self.start())
+        except KeyboardInterrupt:
+            return
@@ -1,49 +1,120 @@
 from __future__ import annotations
 import os
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
 from typing import TYPE_CHECKING
-import json
-from milo.mods.settings import groups as settings_groups
+import time
+from milo.globals import (
+    llm_cache_max_entries,
+    llm_cache_ttl,
+    llm_connect_timeout,
+    llm_keepalive_expiry,
+    llm_max_connections,
+    llm_max_keepalive_connections,
+    llm_request_timeout,
+    llm_singleflight_timeout,
+)
+from milo.handler.chat_record import ChatRecord
+from milo.handler.scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_RESPONSE,
+    scheduler,
+)
+from milo.helpers.cache import TTLCache, normalize_message
+from milo.helpers.metrics import metrics
+from milo.helpers.singleflight import SingleFlight
+from milo.helpers.tool_registry import tool_registry
 
 if TYPE_CHECKING:
-    from typing import Union
+    from typing import AsyncIterator, Union
+    from openai import AsyncOpenAI
     from openai.types.chat.chat_completion import Choice
 
 
+_client: Union[AsyncOpenAI, None] = None
+default_base_url = "https://api.openai.com/v1"
+function_choice_cache = TTLCache(
+    "llm.function_choice_cache", llm_cache_max_entries, llm_cache_ttl
+)
+function_choice_flight = SingleFlight("llm.function_choice_flight")
+
+
+def get_client() -> AsyncOpenAI:
+    """
+    Get the process-wide OpenAI client. It is created on first use so that the
+    environment is only read once and every conversation shares the same
+    connection pool. openai is imported here because it is slow to import
+    and not needed until the first request.
+
+    Returns:
+        AsyncOpenAI
+    """
+    global _client
+
+    if _client is None:
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        load_dotenv()
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=llm_max_connections,
+                max_keepalive_connections=llm_max_keepalive_connections,
+                keepalive_expiry=llm_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                llm_request_timeout, connect=llm_connect_timeout
+            ),
+        )
+        # retries are handled by the scheduler
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            # openai reads an empty value from .env as the URL
+            base_url=os.getenv("OPENAI_BASE_URL") or default_base_url,
+            http_client=http_client,
+            max_retries=0,
+        )
+
+    return _client
+
+
+system_prompt = """You are working as a bot called Milo that
+runs functions play music, text to speech, help manage gaming
+sessions. Ask for more information when necessary. You don't
+need to be very expressive other than providing the user with
+the results in a readable format using markdown for a discord
+user. Use markdown codeblocks whenever displaying tables. If
+there is a json object, try to add it in a table. Keep your
+responses very short and concise. There are some cases where
+the reply will be an empty value. That just means that the
+function called was run successfully and you can tell the user
+that."""
+
+
 class LLMHandler:
     """
-    Class to handle communication with the OpenAI API.
+    Class to handle communication with the OpenAI API. The client is shared
+    between handlers so each handler only holds the state of its own chat.
 
     Attributes:
         client: AsyncOpenAI
         model: str
-        chat_record: list[dict]
-            The entire chat with llm. Fill chat if chat memory is to be used.
+        tts_model: str
+        tts_voice: str
+        tts_format: str
+            Opus can be played in Discord without encoding it again.
+        chat_record: ChatRecord
+            The chat with llm. Older messages are compacted or dropped once
+            it grows past its budget.
     """
 
     def __init__(self):
-        load_dotenv()
-        self.client: AsyncOpenAI = AsyncOpenAI(
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        self.client: AsyncOpenAI = get_client()
         self.model: str = "gpt-4o-mini"
-        self.chat_record: list[dict] = [
-            {
-                "role": "system",
-                "content": """You are working as a bot called Milo that
-                runs functions play music, text to speech, help manage gaming
-                sessions. Ask for more information when necessary. You don't
-                need to be very expressive other than providing the user with
-                the results in a readable format using markdown for a discord
-                user. Use markdown codeblocks whenever displaying tables. If
-                there is a json object, try to add it in a table. Keep your
-                responses very short and concise. There are some cases where
-                the reply will be an empty value. That just means that the
-                function called was run successfully and you can tell the user
-                that.""",
-            }
-        ]
+        self.tts_model: str = "tts-1"
+        self.tts_voice: str = "onyx"
+        self.tts_format: str = "opus"
+        self.chat_record: ChatRecord = ChatRecord(system_prompt)
 
     def add_message_to_record(self, role: str, message: str) -> None:
         """
@@ -53,12 +124,7 @@ class LLMHandler:
             role: str
             message: str
         """
-        self.chat_record.append(
-            {
-                "role": role,
-                "content": message,
-            }
-        )
+        self.chat_record.add_message(role, message)
 
     async def get_function_choice(self) -> Choice:
         """
@@ -68,13 +134,75 @@ class LLMHandler:
         Returns:
             Choice
         """
-        completion = await self.client.chat.completions.create(
-            model=self.model,
-            messages=self.chat_record,
-            tools=self.function_descriptions,
+        cache_key = self.function_choice_cache_key
+        if cache_key is None:
+            return await self.request_function_choice(cache_key)
+
+        cached = function_choice_cache.get(cache_key)
+        if cached is not None:
+            choice, tokens, latency = cached
+            metrics.incr("llm.function_choice_cache.tokens_saved", tokens)
+            metrics.observe("llm.function_choice_cache.latency_saved", latency)
+            return choice
+
+        # the same message sent by several users at once is only sent once
+        return await function_choice_flight.do(
+            cache_key,
+            lambda: self.request_function_choice(cache_key),
+            timeout=llm_singleflight_timeout,
         )
 
-        return completion.choices[0]
+    async def request_function_choice(
+        self, cache_key: Union[tuple, None]
+    ) -> Choice:
+        """
+        Request function choice from OpenAI and cache it if possible.
+
+        Args:
+            cache_key: Union[tuple, None]
+
+        Returns:
+            Choice
+        """
+        start = time.perf_counter()
+        messages = self.chat_record.messages
+        completion = await scheduler.call(
+            "chat",
+            PRIORITY_INTERACTIVE,
+            lambda: self.client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+                tools=tool_registry.schemas,
+            ),
+        )
+        latency = time.perf_counter() - start
+        choice = completion.choices[0]
+
+        # only cache function calls. questions asked by the llm depend on
+        # the conversation
+        if cache_key is not None and choice.finish_reason == "tool_calls":
+            tokens = completion.usage.total_tokens if completion.usage else 0
+            function_choice_cache.set(cache_key, (choice, tokens, latency))
+
+        return choice
+
+    @property
+    def function_choice_cache_key(self) -> Union[tuple, None]:
+        """
+        Key for the function choice cache. Only single-turn conversations
+        (system prompt and one user message) can be cached.
+
+        Returns:
+            Union[tuple, None]
+        """
+        if len(self.chat_record) != 2:
+            return None
+
+        return (
+            self.model,
+            tool_registry.version,
+            normalize_message(self.chat_record.history[0]["content"]),
+        )
 
     async def get_response(
         self, chat_choice: Choice, results: Union[str, dict]
@@ -90,39 +218,86 @@ class LLMHandler:
         Returns:
             Choice
         """
+        self.add_results_to_record(chat_choice, results)
 
-        if chat_choice.finish_reason == "tool_calls":
-            self.chat_record.append(chat_choice.message)
-            self.chat_record.append(
-                {
-                    "role": "tool",
-                    "content": json.dumps({"response": results}),
-                    "tool_call_id": chat_choice.message.tool_calls[0].id,
-                }
-            )
-
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=self.chat_record,
+        messages = self.chat_record.messages
+        response = await scheduler.call(
+            "chat",
+            PRIORITY_RESPONSE,
+            lambda: self.client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+            ),
         )
 
         return response.choices[0]
 
-    async def text_to_speech(self, filepath: str, text: str) -> None:
+    async def stream_response(
+        self, chat_choice: Choice, results: Union[str, dict]
+    ) -> AsyncIterator[str]:
         """
-        Text to speech.
+        Same as get_response but yields the response in pieces as they are
+        generated. The request is not retried since part of it may already
+        be shown.
 
         Args:
-            filepath (): str
-            text (): str
+            chat_choice: Choice
+            results: Union[str, dict]
+
+        Yields:
+            str
         """
-        response = await self.client.audio.speech.create(
-            model="tts-1",
-            voice="onyx",
-            input=text,
-        )
+        self.add_results_to_record(chat_choice, results)
+
+        async with scheduler.slot("chat", PRIORITY_RESPONSE):
+            raw_response = (
+                await self.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=self.chat_record.messages,
+                    stream=True,
+                )
+            )
+            scheduler.observe_headers("chat", raw_response.headers)
 
-        response.stream_to_file(filepath)
+            async for chunk in raw_response.parse():
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    def add_results_to_record(
+        self, chat_choice: Choice, results: Union[str, dict]
+    ) -> None:
+        """
+        Add function call and its results to self.chat_record.
+
+        Args:
+            chat_choice: Choice
+            results: Union[str, dict]
+        """
+        if chat_choice.finish_reason == "tool_calls":
+            self.chat_record.add_tool_call(chat_choice.message, results)
+
+    async def stream_speech(self, text: str) -> AsyncIterator[bytes]:
+        """
+        Text to speech. Audio is yielded as it is downloaded so it can be
+        played before the whole file exists.
+
+        Args:
+            text: str
+
+        Yields:
+            bytes
+        """
+        speech = self.client.audio.speech
+        async with scheduler.slot("audio", PRIORITY_RESPONSE):
+            async with speech.with_streaming_response.create(
+                model=self.tts_model,
+                voice=self.tts_voice,
+                input=text,
+                response_format=self.tts_format,
+            ) as response:
+                scheduler.observe_headers("audio", response.headers)
+                async for chunk in response.iter_bytes():
+                    yield chunk
 
     async def summarize_text(self, text: str, char_limit: int) -> str:
         """
@@ -131,194 +306,19 @@ class LLMHandler:
         Returns:
             Choice
         """
-        completion = await self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"""Summarize into less than {char_limit}
-                    characters: {text}""",
-                }
-            ],
+        completion = await scheduler.call(
+            "chat",
+            PRIORITY_BACKGROUND,
+            lambda: self.client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": f"""Summarize into less than {char_limit}
+                        characters: {text}""",
+                    }
+                ],
+            ),
         )
 
         return completion.choices[0].message.content
-
-    @property
-    def function_descriptions(self) -> list[dict]:
-        """
-        Creates function_description property for class. It contains tools for
-        use with OpenAI function calling.
-
-        Returns:
-            list[dict]
-        """
-        return [
-            {
-                "type": "function",
-                "function": {
-                    "name": "general_General_default",
-                    "description": """Use this function as the default
-                    function. Call this function either when the user wants to
-                    know about our capabilities/features or when there is no
-                    proper match for any other function.""",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "settings_Settings_get_settings_as_dict",
-                    "description": """Use this function to get and show
-                    settings.""",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "group": {
-                                "type": "string",
-                                "enum": settings_groups,
-                            }
-                        },
-                        "required": ["group"],
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "settings_Settings_reset_settings",
-                    "description": """Only use this function if the user
-                    explicitly mentions that they want to reset settings.
-                    The user has to use the word settings. Do not use if
-                    the user only mentions the word default or reset.""",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "group": {
-                                "type": "string",
-                                "enum": settings_groups,
-                            }
-                        },
-                        "required": ["group"],
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "settings_Settings_edit_settings",
-                    "description": """Use this function if the user wants to
-                    edit the settings.""",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "group": {
-                                "type": "string",
-                                "enum": settings_groups,
-                            }
-                        },
-                        "required": ["group"],
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "audio_DiscordAudio_say_text",
-                    "description": """Use this function if the user wants to
-                    say a piece of text.""",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "text": {
-                                "type": "string",
-                                "description": """Just text. Whatever comes
-                                after say""",
-                            }
-                        },
-                        "required": ["text"],
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "audio_DiscordAudio_stream_audio",
-                    "description": """Use this function if the user wants to
-                    play audio that'll be streamed.""",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "query": {
-                                "type": "string",
-                                "description": """A song title or URL.""",
-                            }
-                        },
-                        "required": ["query"],
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "audio_DiscordAudio_pause",
-                    "description": """Use this function if the user wants to
-                    pause sound.""",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "audio_DiscordAudio_resume",
-                    "description": """Use this function if the user wants to
-                    resume sound.""",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "audio_DiscordAudio_stop",
-                    "description": """Use this function if the user wants to
-                    stop sound.""",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "gamebattles_get_schedule",
-                    "description": """Get the schedule for scrims or game
-                    battles. Call this whenever you need to see all sessions
-                    for upcoming scrims or game battles or example when a
-                    customer asks 'scrims?' or 'schedule'""",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "additionalProperties": False,
-                    },
-                },
-            },
-        ]
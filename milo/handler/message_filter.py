@@ -0,0 +1,91 @@
+from __future__ import annotations
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from discord import Message
+    from typing import Optional
+
+
+class MessageFilter:
+    """
+    Class to find messages addressed to the bot, either with the wake word or
+    a mention at the start. It runs on every message the bot can see so it
+    only looks at the start of the content and does not copy or lowercase it.
+
+    Attributes:
+        default_wake_word: str
+        wake_words: dict[int, str]
+            guild id: wake word used instead of the default
+        bot_id: Optional[int]
+            Mentions are recognised once the bot's user id is known.
+        patterns: dict[Optional[int], tuple[re.Pattern, int]]
+            guild id: (compiled pattern, longest prefix it can match)
+    """
+
+    def __init__(
+        self, default_wake_word: str, wake_words: dict[int, str]
+    ) -> None:
+        self.default_wake_word = default_wake_word
+        self.wake_words = dict(wake_words)
+        self.bot_id: Optional[int] = None
+        self.patterns: dict[Optional[int], tuple[re.Pattern, int]] = dict()
+
+    def compile(self, wake_word: str) -> tuple[re.Pattern, int]:
+        """
+        Args:
+            wake_word: str
+
+        Returns:
+            tuple[re.Pattern, int]
+        """
+        alternatives = [re.escape(wake_word)]
+        max_len = len(wake_word)
+        if self.bot_id is not None:
+            alternatives.append(rf"<@!?{self.bot_id}>")
+            max_len = max(max_len, len(f"<@!{self.bot_id}>"))
+        pattern = re.compile("|".join(alternatives), re.IGNORECASE)
+        return pattern, max_len
+
+    def pattern(self, guild_id: Optional[int]) -> tuple[re.Pattern, int]:
+        """
+        Get the compiled pattern for a guild, compiling it the first time.
+
+        Args:
+            guild_id: Optional[int]
+
+        Returns:
+            tuple[re.Pattern, int]
+        """
+        compiled = self.patterns.get(guild_id)
+        if compiled is None:
+            wake_word = self.wake_words.get(guild_id, self.default_wake_word)
+            compiled = self.compile(wake_word)
+            self.patterns[guild_id] = compiled
+        return compiled
+
+    def set_bot_id(self, bot_id: int) -> None:
+        if bot_id != self.bot_id:
+            self.bot_id = bot_id
+            self.patterns.clear()
+
+    def set_wake_word(self, guild_id: int, wake_word: str) -> None:
+        self.wake_words[guild_id] = wake_word
+        self.patterns.pop(guild_id, None)
+
+    def prefix_end(self, message: Message) -> Optional[int]:
+        """
+        Check if the message starts with the wake word or a mention.
+
+        Args:
+            message: Message
+
+        Returns:
+            Optional[int]
+                Index where the rest of the message starts or None if the
+                message is not addressed to the bot.
+        """
+        guild = message.guild
+        pattern, max_len = self.pattern(guild.id if guild else None)
+        match = pattern.match(message.content, 0, max_len)
+        return match.end() if match else None
@@ -1,16 +1,10 @@
 from __future__ import annotations
 import json
-from asyncio import TimeoutError
 from typing import TYPE_CHECKING
-from milo.helpers.discord.checks import is_reply_to_message
-from milo.globals import (
-    app_logger,
-    bot_name,
-    bot_name_len,
-    parent_mod,
-    timeout_wait_for_reply,
-)
+from milo.globals import app_logger
 from milo.handler.llm import LLMHandler
+from milo.handler.router import route_message
+from milo.helpers.tool_registry import tool_registry
 
 if TYPE_CHECKING:
     from discord import Message
@@ -22,41 +16,43 @@ async def process_message(
     dc_handler: DiscordHandler,
     message: Message,
     llm_handler: LLMHandler = None,
+    prefix_end: int = 0,
 ) -> None:
     """
     Gets function data based on user message and tries to call that function.
-    It will recursively call itself if the bot needs more information to make
-    a decision.
+    If the bot needs more information to make a decision, it asks and the
+    conversation continues when the user replies to that question.
 
     Args:
         dc_handler: DiscordHandler
         message: Message
         llm_handler: LLMHandler
+        prefix_end: int
+            Where the message starts after the wake word or mention. Messages
+            that are not addressed to the bot are filtered out by on_message.
     """
     username = str(message.author)
-    message_content = str(message.content)
     channel = str(message.channel)
 
-    message_content = message_content.lower()
-    # stop processing if the bot name wasn't used as an initial message
-    # or if an llm_handler does not exist (it will exist if it is a reply
-    # message in an already started chat with the bot
-    if not (message_content.startswith(bot_name) or llm_handler):
-        return
-
-    # create new variable without bot name in message for further processing
-    if message_content.startswith(bot_name):
-        user_message = message_content[bot_name_len:]
-    else:
-        user_message = message_content
-
-    user_message = user_message.lstrip()
+    # create new variable without wake word in message for further processing
+    text = str(message.content)[prefix_end:]
+    user_message = text.lower().lstrip()
     app_logger.debug(f"[{channel}] {username}: '{user_message}'")
 
-    # create llm_handler if not already created (only created when the function
-    # is called recursively). used to keep track of chat session with bot
+    # create llm_handler if not already created (it is passed in when the
+    # message continues a conversation). used to keep track of chat session
+    # with bot
     if not llm_handler:
         llm_handler = LLMHandler()
+
+        # skip the llm for commands that can be understood locally. the
+        # original message is used so that arguments like URLs keep their case
+        route = route_message(text)
+        if route:
+            tool, args = route
+            await tool(dc_handler, message, args, llm_handler, None)
+            return
+
     llm_handler.add_message_to_record("user", user_message)
     chat_choice = await llm_handler.get_function_choice()
     finish_reason = chat_choice.finish_reason
@@ -68,32 +64,13 @@ async def process_message(
         llm_handler.add_message_to_record("assistant", reply_assistant)
         message_assistant = await message.reply(reply_assistant)
 
-        def check_for_reply(m):
-            if m.reference is not None:
-                if is_reply_to_message(m, message_assistant):
-                    return True
-            return False
-
-        # let Discord wait for reply to assistant message with specified
-        # timeout
-        try:
-            message_reply_user = await dc_handler.client.wait_for(
-                "message",
-                check=check_for_reply,
-                timeout=timeout_wait_for_reply,
-            )
+        # the user's reply is routed back here by on_message
         # TODO: replies even if the message has nothing to do with bot
         # functions. For example, if there is a random question like
         # asking who it is, it will repond like a human and then respond
         # with "Ignoring. Took too long." even though there is no prompt
         # for a response - no prompt is the expected behaviour.
-        except TimeoutError:
-            await message.reply("Ignoring. Took too long.")
-            return
-
-        # if there is a user reply, recursively call function
-        if message_reply_user:
-            await process_message(dc_handler, message_reply_user, llm_handler)
+        dc_handler.conversations.open(message, message_assistant, llm_handler)
 
     # once there is enough information, make funciton call
     elif finish_reason == "tool_calls":
@@ -128,17 +105,12 @@ def call_function(
         chat_choice.message.tool_calls[0].function.arguments
     )
 
-    d = "_"
-    split_data = func_identifier.split(d)
-    module_name = split_data[0]
-    class_name = split_data[1]
-    func_name = d.join(split_data[2:])
+    tool = tool_registry.get(func_identifier)
+    if tool is None:
+        app_logger.error(f"Function '{func_identifier}' does not exist.")
+        return message.reply("Something went wrong.")
 
-    module = __import__(f"{parent_mod}.{module_name}", fromlist=["object"])
-    class_obj = getattr(module, class_name)(
-        dc_handler, message, func_args, llm_handler
-    )
     try:
-        return getattr(class_obj, func_name)(chat_choice)
+        return tool(dc_handler, message, func_args, llm_handler, chat_choice)
     except Exception as e:
         app_logger.error(e)
@@ -1,12 +1,19 @@
 from __future__ import annotations
+import time
 from discord import ui
 
 from typing import TYPE_CHECKING
+from milo.globals import (
+    discord_message_max_chars,
+    llm_stream_responses,
+    stream_edit_interval,
+)
+from milo.helpers.renderers import render_results
 
 if TYPE_CHECKING:
     from discord import Interaction, Message
     from openai.types.chat.chat_completion import Choice
-    from typing import Union
+    from typing import Any, Awaitable, Callable, Optional, Union
     from milo.handler.llm import LLMHandler
 
 
@@ -16,35 +23,112 @@ class Responder:
 
     Attributes:
         llm_handler: LLMHandler
-        chat_choice: Choice
+        chat_choice: Optional[Choice]
+            None if the function was chosen without the llm.
         results: Union[str, dict]
         view: Union[ui.View, None]
+        llm_format: bool
+            Use the llm to format results. Results are rendered locally if
+            False.
+        stream: bool
+            Stream llm responses by editing the reply as text arrives.
     """
 
     def __init__(
         self,
         llm_handler: LLMHandler,
-        chat_choice: Choice,
+        chat_choice: Optional[Choice],
         results: Union[str, dict],
         view: Union[ui.View, None] = None,
+        llm_format: bool = False,
+        stream: bool = llm_stream_responses,
     ):
         self.llm_handler = llm_handler
         self.chat_choice = chat_choice
         self.results = results
         self.view = view
+        self.llm_format = llm_format
+        self.stream = stream
 
     async def create_response(self) -> str:
         """
-        Creates human readable response using llm.
+        Creates human readable response. Uses the llm only if llm_format is
+        set and there is a chat_choice (the llm was used to choose the
+        function).
 
         Returns:
             str
         """
+        if not self.llm_format or self.chat_choice is None:
+            return render_results(self.results)
+
         response = await self.llm_handler.get_response(
             self.chat_choice, self.results
         )
         return response.message.content
 
+    async def stream_response(
+        self,
+        send: Callable[[str], Awaitable[Any]],
+        edit: Callable[[str], Awaitable[Any]],
+    ) -> Any:
+        """
+        Streams human readable response using llm. The first piece of text is
+        sent as soon as it arrives. The rest is collected and the message is
+        edited at most every stream_edit_interval seconds to stay within
+        Discord rate limits.
+
+        Args:
+            send: Callable[[str], Awaitable[Any]]
+                Sends the first message.
+            edit: Callable[[str], Awaitable[Any]]
+                Edits the sent message.
+
+        Returns:
+            Any
+                Result of send.
+        """
+        # send can return None, so whether it ran is tracked on its own
+        first_sent = False
+        sent = None
+        content = ""
+        content_shown = ""
+        last_edit = 0.0
+
+        async for delta in self.llm_handler.stream_response(
+            self.chat_choice, self.results
+        ):
+            content = (content + delta)[:discord_message_max_chars]
+            if not content.strip():
+                continue
+
+            now = time.monotonic()
+            if not first_sent:
+                sent = await send(content)
+                first_sent = True
+                content_shown = content
+                last_edit = now
+            elif now - last_edit >= stream_edit_interval:
+                await edit(content)
+                content_shown = content
+                last_edit = now
+
+        if not first_sent:
+            return await send(content or render_results(None))
+        if content != content_shown:
+            await edit(content)
+        return sent
+
+    @property
+    def streaming(self) -> bool:
+        """
+        Only responses created by the llm can be streamed.
+
+        Returns:
+            bool
+        """
+        return self.stream and self.llm_format and self.chat_choice is not None
+
     async def reply_to_message(self, message: Message) -> Message:
         """
         Replies to Discord message and returns message object in case it needs
@@ -56,6 +140,19 @@ class Responder:
         Returns:
             Message
         """
+        if self.streaming:
+            bot_message = None
+
+            async def send(content: str) -> Message:
+                nonlocal bot_message
+                bot_message = await message.reply(content, view=self.view)
+                return bot_message
+
+            async def edit(content: str) -> None:
+                await bot_message.edit(content=content)
+
+            return await self.stream_response(send, edit)
+
         response = await self.create_response()
         return await message.reply(response, view=self.view)
 
@@ -66,6 +163,19 @@ class Responder:
         Args:
             interaction: Interaction
         """
+        if self.streaming:
+
+            async def send(content: str) -> None:
+                await interaction.response.edit_message(
+                    content=content, view=self.view
+                )
+
+            async def edit(content: str) -> None:
+                await interaction.edit_original_response(content=content)
+
+            await self.stream_response(send, edit)
+            return
+
         response = await self.create_response()
         await interaction.response.edit_message(
             content=response, view=self.view
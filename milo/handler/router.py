@@ -0,0 +1,106 @@
+from __future__ import annotations
+import re
+from typing import TYPE_CHECKING
+from milo.helpers.metrics import metrics
+from milo.helpers.tool_registry import tool_registry
+
+if TYPE_CHECKING:
+    from typing import Callable, Union
+    from milo.helpers.tool_registry import Tool
+
+
+def _no_args(match: re.Match) -> dict:
+    return {}
+
+
+def _server_group(match: re.Match) -> dict:
+    return {"group": "server"}
+
+
+def _query_url(match: re.Match) -> Union[dict, None]:
+    # only URLs are unambiguous. searches are left for the llm to rewrite.
+    import validators
+
+    query = match.group("query")
+    if not validators.url(query):
+        return None
+    return {"query": query}
+
+
+def _text(match: re.Match) -> dict:
+    return {"text": match.group("text")}
+
+
+_target = r"(?:\s+(?:the\s+)?(?:music|song|audio|sound|track))?[.!]*"
+
+# (pattern, tool name, function to create the tool args from the match).
+# patterns are matched against the whole message so anything with extra words
+# is left for the llm.
+intents: tuple[tuple[re.Pattern, str, Callable], ...] = (
+    (
+        re.compile(rf"pause{_target}", re.IGNORECASE),
+        "audio_DiscordAudio_pause",
+        _no_args,
+    ),
+    (
+        re.compile(rf"(?:resume|unpause){_target}", re.IGNORECASE),
+        "audio_DiscordAudio_resume",
+        _no_args,
+    ),
+    (
+        re.compile(rf"stop{_target}", re.IGNORECASE),
+        "audio_DiscordAudio_stop",
+        _no_args,
+    ),
+    (
+        re.compile(r"play\s+<?(?P<query>\S+?)>?", re.IGNORECASE),
+        "audio_DiscordAudio_stream_audio",
+        _query_url,
+    ),
+    (
+        re.compile(r"say\s+(?P<text>.+)", re.IGNORECASE | re.DOTALL),
+        "audio_DiscordAudio_say_text",
+        _text,
+    ),
+    (
+        re.compile(
+            r"(?:(?:show|get|list)\s+)?(?:the\s+)?(?:server\s+)?settings"
+            r"[.!?]*",
+            re.IGNORECASE,
+        ),
+        "settings_Settings_get_settings_as_dict",
+        _server_group,
+    ),
+)
+
+
+def route_message(user_message: str) -> Union[tuple[Tool, dict], None]:
+    """
+    Match user message against commands that don't need the llm to be
+    understood.
+
+    Args:
+        user_message: str
+            Message without the bot name.
+
+    Returns:
+        Union[tuple[Tool, dict], None]
+            Tool and args if there is a match.
+    """
+    text = user_message.strip()
+
+    for pattern, tool_name, get_args in intents:
+        match = pattern.fullmatch(text)
+        if match is None:
+            continue
+
+        args = get_args(match)
+        if args is None:
+            break
+
+        metrics.incr("router.hit")
+        metrics.incr(f"router.hit.{tool_name}")
+        return tool_registry.get(tool_name), args
+
+    metrics.incr("router.miss")
+    return None
@@ -0,0 +1,314 @@
+from __future__ import annotations
+import heapq
+import itertools
+import random
+import re
+import time
+from asyncio import CancelledError, get_running_loop, sleep
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+from milo.globals import (
+    app_logger,
+    llm_concurrency,
+    llm_max_retries,
+    llm_retry_base_delay,
+    llm_retry_max_delay,
+)
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from asyncio import Future, TimerHandle
+    from httpx import Headers
+    from typing import Any, AsyncIterator, Awaitable, Callable, Union
+
+# lower runs first
+PRIORITY_INTERACTIVE = 0  # choosing what to do with a user message
+PRIORITY_RESPONSE = 1  # replies and speech
+PRIORITY_BACKGROUND = 2  # summarizing and anything else not waited on
+
+_duration_part = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_duration_units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(duration: str) -> float:
+    """
+    Parse durations used in OpenAI rate limit headers like '6m0s' or '20ms'.
+
+    Args:
+        duration: str
+
+    Returns:
+        float
+            Seconds.
+    """
+    seconds = 0.0
+    for value, unit in _duration_part.findall(duration):
+        seconds += float(value) * _duration_units[unit]
+    return seconds
+
+
+class Endpoint:
+    """
+    Class to hold the scheduling state of one API endpoint.
+
+    Attributes:
+        name: str
+        limit: int
+            Maximum requests running at the same time.
+        active: int
+        waiters: list
+            Heap of (priority, order, future).
+        remaining: dict[str, int]
+            Requests and tokens left according to the last rate limit headers.
+        reset_at: dict[str, float]
+            When remaining resets (monotonic time).
+        wakeup: Union[TimerHandle, None]
+    """
+
+    def __init__(self, name: str, limit: int) -> None:
+        self.name = name
+        self.limit = limit
+        self.active: int = 0
+        self.waiters: list = list()
+        self.remaining: dict[str, int] = dict()
+        self.reset_at: dict[str, float] = dict()
+        self.wakeup: Union[TimerHandle, None] = None
+
+    def rate_limited_for(self) -> float:
+        """
+        Seconds until the endpoint can be used again. 0 if it can be used now.
+
+        Returns:
+            float
+        """
+        now = time.monotonic()
+        delay = 0.0
+        for kind, remaining in self.remaining.items():
+            reset_at = self.reset_at.get(kind, 0.0)
+            if remaining <= 0 and reset_at > now:
+                delay = max(delay, reset_at - now)
+        return delay
+
+
+class RequestScheduler:
+    """
+    Class to coordinate requests to the OpenAI API from every conversation.
+    Each endpoint has a concurrency cap and a request budget fed by the rate
+    limit headers of responses. Waiting requests run in order of priority and
+    then arrival. Failed requests are retried with jittered exponential
+    backoff.
+
+    Attributes:
+        endpoints: dict[str, Endpoint]
+        max_retries: int
+        retry_base_delay: float
+        retry_max_delay: float
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, int],
+        max_retries: int,
+        retry_base_delay: float,
+        retry_max_delay: float,
+    ) -> None:
+        self.endpoints: dict[str, Endpoint] = {
+            name: Endpoint(name, limit) for name, limit in limits.items()
+        }
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._order = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, endpoint_name: str, priority: int) -> AsyncIterator:
+        """
+        Context manager that waits for the endpoint to be free and holds it
+        while the block runs.
+
+        Args:
+            endpoint_name: str
+            priority: int
+        """
+        endpoint = self.endpoints[endpoint_name]
+        start = time.perf_counter()
+
+        future: Future = get_running_loop().create_future()
+        heapq.heappush(endpoint.waiters, (priority, next(self._order), future))
+        self.dispatch(endpoint)
+        try:
+            await future
+        except CancelledError:
+            if future.done() and not future.cancelled():
+                # slot was given right before being cancelled
+                self.release(endpoint)
+            raise
+        finally:
+            self.update_gauges(endpoint)
+
+        metrics.observe(
+            f"scheduler.{endpoint.name}.wait", time.perf_counter() - start
+        )
+        try:
+            yield
+        finally:
+            self.release(endpoint)
+
+    def dispatch(self, endpoint: Endpoint) -> None:
+        """
+        Give free slots to waiting requests unless the endpoint is rate
+        limited.
+
+        Args:
+            endpoint: Endpoint
+        """
+        while endpoint.waiters and endpoint.active < endpoint.limit:
+            delay = endpoint.rate_limited_for()
+            if delay:
+                if endpoint.wakeup is None:
+                    endpoint.wakeup = get_running_loop().call_later(
+                        delay, self.wake, endpoint
+                    )
+                break
+
+            priority, order, future = heapq.heappop(endpoint.waiters)
+            if future.done():
+                continue
+
+            endpoint.active += 1
+            if "requests" in endpoint.remaining:
+                endpoint.remaining["requests"] -= 1
+            future.set_result(None)
+
+        self.update_gauges(endpoint)
+
+    def wake(self, endpoint: Endpoint) -> None:
+        endpoint.wakeup = None
+        self.dispatch(endpoint)
+
+    def release(self, endpoint: Endpoint) -> None:
+        endpoint.active -= 1
+        self.dispatch(endpoint)
+
+    def observe_headers(self, endpoint_name: str, headers: Headers) -> None:
+        """
+        Update the request budget of the endpoint from rate limit headers.
+
+        Args:
+            endpoint_name: str
+            headers: Headers
+        """
+        endpoint = self.endpoints[endpoint_name]
+        now = time.monotonic()
+
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = headers.get(f"x-ratelimit-reset-{kind}")
+            if remaining is None or reset is None:
+                continue
+            try:
+                endpoint.remaining[kind] = int(remaining)
+            except ValueError:
+                continue
+            endpoint.reset_at[kind] = now + parse_duration(reset)
+
+    async def call(
+        self,
+        endpoint_name: str,
+        priority: int,
+        request: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Run request when the endpoint is free and retry it if it fails with an
+        error that is likely to go away.
+
+        Args:
+            endpoint_name: str
+            priority: int
+            request: Callable[[], Awaitable[Any]]
+                Creates the request. It must return a raw response
+                (with_raw_response) so the headers can be read.
+
+        Returns:
+            Any
+                Parsed response.
+        """
+        # openai is slow to import. it is loaded by the time a request is made
+        from openai import (
+            APIConnectionError,
+            APITimeoutError,
+            InternalServerError,
+            RateLimitError,
+        )
+
+        retryable_errors = (
+            APIConnectionError,
+            APITimeoutError,
+            InternalServerError,
+            RateLimitError,
+        )
+
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(endpoint_name, priority):
+                    raw_response = await request()
+                    self.observe_headers(endpoint_name, raw_response.headers)
+                return raw_response.parse()
+
+            except retryable_errors as e:
+                response = getattr(e, "response", None)
+                if response is not None:
+                    self.observe_headers(endpoint_name, response.headers)
+                if isinstance(e, RateLimitError):
+                    metrics.incr(f"scheduler.{endpoint_name}.rate_limited")
+
+                if attempt >= self.max_retries:
+                    raise
+
+                attempt += 1
+                metrics.incr(f"scheduler.{endpoint_name}.retries")
+                delay = self.retry_delay(attempt, response)
+                app_logger.warning(
+                    f"Retrying {endpoint_name} request in {delay:.2f}s: {e}"
+                )
+                await sleep(delay)
+
+    def retry_delay(self, attempt: int, response: Any) -> float:
+        """
+        Exponential backoff with full jitter. Retry-after headers are used
+        when they are longer.
+
+        Args:
+            attempt: int
+            response: Any
+
+        Returns:
+            float
+        """
+        backoff = min(
+            self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1)
+        )
+        delay = random.uniform(0, backoff)
+
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            try:
+                delay = max(delay, float(retry_after))
+            except (TypeError, ValueError):
+                pass
+        return delay
+
+    def update_gauges(self, endpoint: Endpoint) -> None:
+        metrics.set_gauge(
+            f"scheduler.{endpoint.name}.queue_depth", len(endpoint.waiters)
+        )
+        metrics.set_gauge(f"scheduler.{endpoint.name}.active", endpoint.active)
+
+
+scheduler = RequestScheduler(
+    llm_concurrency,
+    llm_max_retries,
+    llm_retry_base_delay,
+    llm_retry_max_delay,
+)
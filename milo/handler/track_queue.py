@@ -0,0 +1,230 @@
+from __future__ import annotations
+from asyncio import Lock, create_task
+from collections import deque
+from typing import TYPE_CHECKING
+from milo.globals import app_logger, track_queue_max_length
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from asyncio import Task
+    from typing import Awaitable, Callable, Coroutine, Optional
+
+    Resolver = Callable[[str], Awaitable[dict]]
+
+
+class Track:
+    """
+    Class for a song requested in a guild.
+
+    Attributes:
+        query: str
+            Song title or URL as the user asked for it.
+        requested_by: str
+        info: Optional[dict]
+            Title and audio URL once resolved.
+        prefetch: Optional[Task]
+            Resolves the track while the one before it plays. Its result is
+            None if resolving failed.
+    """
+
+    def __init__(self, query: str, requested_by: str) -> None:
+        self.query = query
+        self.requested_by = requested_by
+        self.info: Optional[dict] = None
+        self.prefetch: Optional[Task] = None
+
+    @property
+    def title(self) -> str:
+        return self.info["title"] if self.info else self.query
+
+    def cancel(self) -> None:
+        if self.prefetch is not None:
+            self.prefetch.cancel()
+
+
+class TrackQueue:
+    """
+    Class to queue tracks per guild. Adding and taking tracks are O(1).
+
+    The voice client's after callback takes the next track when one ends.
+    The track after the one playing is resolved in the background, so a
+    track that was queued in time starts without waiting for extraction.
+
+    Attributes:
+        max_length: int
+            Tracks waiting per guild.
+        queues: dict[int, deque[Track]]
+            guild id: tracks waiting. Empty queues are removed.
+        current: dict[int, Track]
+            guild id: track playing or being resolved to play. A track that
+            is replaced by other audio, skipped or stopped is no longer
+            current, so its after callback does not start the next one.
+        locks: dict[int, Lock]
+            guild id: held while connecting, starting or stopping audio so
+            voice actions in a guild don't interleave. Not held while a
+            track is resolved, so a stop doesn't wait for it.
+        tasks: set[Task]
+    """
+
+    def __init__(self, max_length: int) -> None:
+        self.max_length = max_length
+        self.queues: dict[int, deque[Track]] = dict()
+        self.current: dict[int, Track] = dict()
+        self.locks: dict[int, Lock] = dict()
+        self.tasks: set[Task] = set()
+
+    def enqueue(self, guild_id: int, track: Track) -> Optional[int]:
+        """
+        Add track to the end of the guild's queue.
+
+        Args:
+            guild_id: int
+            track: Track
+
+        Returns:
+            Optional[int]
+                Position in the queue, None if the queue is full.
+        """
+        queue = self.queues.setdefault(guild_id, deque())
+        if len(queue) >= self.max_length:
+            metrics.incr("track_queue.full")
+            return None
+
+        queue.append(track)
+        metrics.incr("track_queue.enqueued")
+        return len(queue)
+
+    def next(self, guild_id: int) -> Optional[Track]:
+        """
+        Take the next track and make it current.
+
+        Args:
+            guild_id: int
+
+        Returns:
+            Optional[Track]
+                None if the queue is empty.
+        """
+        queue = self.queues.get(guild_id)
+        if not queue:
+            self.current.pop(guild_id, None)
+            return None
+
+        track = queue.popleft()
+        if not queue:
+            del self.queues[guild_id]
+        self.current[guild_id] = track
+        return track
+
+    def playing(self, guild_id: int) -> Optional[Track]:
+        return self.current.get(guild_id)
+
+    def is_current(self, guild_id: int, track: Track) -> bool:
+        return self.current.get(guild_id) is track
+
+    def release(self, guild_id: int) -> None:
+        """
+        Stop advancing the queue when the current track ends. Tracks that
+        are waiting stay queued.
+
+        Args:
+            guild_id: int
+        """
+        self.current.pop(guild_id, None)
+
+    def lock(self, guild_id: int) -> Lock:
+        lock = self.locks.get(guild_id)
+        if lock is None:
+            lock = self.locks[guild_id] = Lock()
+        return lock
+
+    def waiting(self, guild_id: int) -> int:
+        return len(self.queues.get(guild_id, ()))
+
+    def tracks(self, guild_id: int) -> list[Track]:
+        return list(self.queues.get(guild_id, ()))
+
+    def clear(self, guild_id: int) -> int:
+        """
+        Remove the tracks waiting in the guild's queue.
+
+        Args:
+            guild_id: int
+
+        Returns:
+            int
+                Number of tracks removed.
+        """
+        queue = self.queues.pop(guild_id, deque())
+        for track in queue:
+            track.cancel()
+        return len(queue)
+
+    def forget(self, guild_id: int) -> None:
+        """
+        Drop the guild's queue. Called when the voice client disconnects.
+        The guild's lock is dropped too unless it is held.
+
+        Args:
+            guild_id: int
+        """
+        self.clear(guild_id)
+        self.release(guild_id)
+        lock = self.locks.get(guild_id)
+        if lock is not None and not lock.locked():
+            del self.locks[guild_id]
+
+    def prefetch(self, guild_id: int, resolve: Resolver) -> None:
+        """
+        Start resolving the next track in the guild's queue if it isn't
+        already.
+
+        Args:
+            guild_id: int
+            resolve: Resolver
+        """
+        queue = self.queues.get(guild_id)
+        if not queue or queue[0].prefetch is not None:
+            return
+        track = queue[0]
+
+        async def fetch() -> Optional[dict]:
+            try:
+                return await resolve(track.query)
+            except Exception as e:
+                # tried again when the track is played
+                app_logger.warning(f"Prefetching {track.query!r} failed: {e}")
+                return None
+
+        track.prefetch = create_task(fetch())
+        metrics.incr("track_queue.prefetches")
+
+    async def resolve(self, track: Track, resolve: Resolver) -> dict:
+        """
+        Get title and audio URL of track, from its prefetch if there is one.
+
+        Args:
+            track: Track
+            resolve: Resolver
+
+        Returns:
+            dict
+        """
+        if track.prefetch is not None:
+            if track.prefetch.done():
+                metrics.incr("track_queue.prefetch.ready")
+            else:
+                metrics.incr("track_queue.prefetch.waited")
+            track.info = await track.prefetch
+
+        if track.info is None:
+            track.info = await resolve(track.query)
+        return track.info
+
+    def start(self, coro: Coroutine) -> None:
+        task = create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+
+track_queue = TrackQueue(track_queue_max_length)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import heapq
+import itertools
+from asyncio import create_task, get_running_loop
+from typing import TYPE_CHECKING
+from milo.globals import app_logger, voice_client_disconnect_time
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from asyncio import AbstractEventLoop, Task, TimerHandle
+    from discord import VoiceClient
+    from typing import Union
+
+
+class IdleDisconnect:
+    """
+    Class to disconnect voice clients that have not played anything for
+    timeout seconds. Voice clients report when they start and stop playing;
+    nothing runs in between, no matter how many are connected.
+
+    A voice client that is idle has one deadline. Deadlines are kept in a
+    heap and a single timer is set for the earliest one. Resetting a deadline
+    pushes a new entry and leaves the old one to be skipped when it comes up.
+
+    Attributes:
+        timeout: float
+        voice_clients: dict[int, VoiceClient]
+            guild id: voice client
+        deadlines: dict[int, float]
+            guild id: event loop time to disconnect at. Voice clients that
+            are playing have none.
+        heap: list
+            Heap of (deadline, order, guild id).
+        wakeup: Union[TimerHandle, None]
+        wakeup_at: float
+        loop: Union[AbstractEventLoop, None]
+        tasks: set[Task]
+    """
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self.voice_clients: dict[int, VoiceClient] = dict()
+        self.deadlines: dict[int, float] = dict()
+        self.heap: list = list()
+        self.wakeup: Union[TimerHandle, None] = None
+        self.wakeup_at: float = 0.0
+        self.loop: Union[AbstractEventLoop, None] = None
+        self.tasks: set[Task] = set()
+        self._order = itertools.count()
+
+    def idle(self, voice_client: VoiceClient) -> None:
+        """
+        Start or restart the countdown to disconnect. Called when the voice
+        client connects, stops or is paused.
+
+        Args:
+            voice_client: VoiceClient
+        """
+        if self.loop is None:
+            self.loop = get_running_loop()
+
+        # the after callback of a replaced source can arrive late
+        if voice_client.is_playing():
+            self.busy(voice_client)
+            return
+
+        self.set_deadline(voice_client)
+        self.schedule()
+        metrics.set_gauge("voice_idle.waiting", len(self.deadlines))
+
+    def set_deadline(self, voice_client: VoiceClient) -> None:
+        guild_id = voice_client.guild.id
+        deadline = self.loop.time() + self.timeout
+        self.voice_clients[guild_id] = voice_client
+        self.deadlines[guild_id] = deadline
+        heapq.heappush(self.heap, (deadline, next(self._order), guild_id))
+
+    def busy(self, voice_client: VoiceClient) -> None:
+        """
+        Stop the countdown. Called when the voice client starts playing or
+        is resumed.
+
+        Args:
+            voice_client: VoiceClient
+        """
+        if self.loop is None:
+            self.loop = get_running_loop()
+
+        guild_id = voice_client.guild.id
+        self.voice_clients[guild_id] = voice_client
+        self.deadlines.pop(guild_id, None)
+        metrics.set_gauge("voice_idle.waiting", len(self.deadlines))
+
+    def idle_threadsafe(self, voice_client: VoiceClient) -> None:
+        """
+        Same as idle but can be called from the audio player thread, for
+        example in the after callback of VoiceClient.play.
+
+        Args:
+            voice_client: VoiceClient
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.idle, voice_client)
+
+    def forget(self, guild_id: int) -> None:
+        """
+        Stop tracking the guild's voice client after it disconnected.
+
+        Args:
+            guild_id: int
+        """
+        self.voice_clients.pop(guild_id, None)
+        self.deadlines.pop(guild_id, None)
+        metrics.set_gauge("voice_idle.waiting", len(self.deadlines))
+
+    def schedule(self) -> None:
+        """
+        Set the timer for the earliest deadline.
+        """
+        if not self.heap:
+            return
+
+        deadline = self.heap[0][0]
+        if self.wakeup is not None:
+            if self.wakeup_at <= deadline:
+                return
+            self.wakeup.cancel()
+
+        self.wakeup_at = deadline
+        self.wakeup = self.loop.call_at(deadline, self.expire)
+
+    def expire(self) -> None:
+        """
+        Disconnect every voice client whose deadline has passed.
+        """
+        self.wakeup = None
+        now = self.loop.time()
+
+        while self.heap and self.heap[0][0] <= now:
+            deadline, _, guild_id = heapq.heappop(self.heap)
+            # skip deadlines that were reset or stopped
+            if self.deadlines.get(guild_id) != deadline:
+                continue
+
+            voice_client = self.voice_clients[guild_id]
+            if voice_client.is_playing():
+                # started playing without telling us. check again later in
+                # case it also stops without telling us
+                self.set_deadline(voice_client)
+                continue
+
+            del self.deadlines[guild_id]
+            del self.voice_clients[guild_id]
+            task = create_task(self.disconnect(voice_client))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        metrics.set_gauge("voice_idle.waiting", len(self.deadlines))
+        self.schedule()
+
+    async def disconnect(self, voice_client: VoiceClient) -> None:
+        metrics.incr("voice_idle.disconnected")
+        try:
+            if voice_client.is_connected():
+                await voice_client.disconnect()
+        except Exception as e:
+            app_logger.error(e)
+
+
+idle_disconnect = IdleDisconnect(voice_client_disconnect_time)
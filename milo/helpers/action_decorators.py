@@ -1,4 +1,5 @@
 from __future__ import annotations
+from functools import wraps
 from typing import TYPE_CHECKING
 from milo.handler.responder import Responder
 from milo.helpers.discord.ui import ConfirmView, FormModal
@@ -16,6 +17,7 @@ def no_response(f):
             function using the decorator
     """
 
+    @wraps(f)
     async def wrapper(class_obj: type, chat_choice: Choice) -> None:
         """
         Inner function for no_response decorator. Runs function and replies
@@ -37,32 +39,47 @@ def no_response(f):
     return wrapper
 
 
-def simple_response(f):
+def simple_response(f=None, *, llm_format: bool = False):
     """
-    Decorator: runs function and uses llm to handle result formatting.
+    Decorator: runs function and replies with the results. Results are
+    rendered locally unless llm_format is set. Can be used with or without
+    arguments.
 
     Args:
         f ()
             function using the decorator
+        llm_format: bool
+            Use the llm to handle result formatting.
     """
 
-    async def wrapper(class_obj: type, chat_choice: Choice) -> None:
-        """
-        Inner function for simple_response decorator. Runs function and replies
-        to message.
+    def function_collector(f):
+        @wraps(f)
+        async def wrapper(class_obj: type, chat_choice: Choice) -> None:
+            """
+            Inner function for simple_response decorator. Runs function and
+            replies to message.
 
-        Args:
-            class_obj: type
-                The methods being called are from within a class so a class
-                object is needed. It is the same as calling the
-                function using self.f()
-            chat_choice: Choice
-        """
-        results = await f(class_obj)
-        responder = Responder(class_obj.llm_handler, chat_choice, results)
-        await responder.reply_to_message(class_obj.message)
+            Args:
+                class_obj: type
+                    The methods being called are from within a class so a
+                    class object is needed. It is the same as calling the
+                    function using self.f()
+                chat_choice: Choice
+            """
+            results = await f(class_obj)
+            responder = Responder(
+                class_obj.llm_handler,
+                chat_choice,
+                results,
+                llm_format=llm_format,
+            )
+            await responder.reply_to_message(class_obj.message)
 
-    return wrapper
+        return wrapper
+
+    if f is None:
+        return function_collector
+    return function_collector(f)
 
 
 def admin_privileges(f):
@@ -74,6 +91,7 @@ def admin_privileges(f):
             function using the decorator
     """
 
+    @wraps(f)
     async def wrapper(class_obj: type, chat_choice: Choice) -> None:
         """
         Inner function for admin_privileges decorator. Runs function if the
@@ -99,7 +117,7 @@ def admin_privileges(f):
     return wrapper
 
 
-def confirm_decision_response(additional_process=None):
+def confirm_decision_response(additional_process=None, llm_format=False):
     """
     Decorator: Prompts the user to confirm if they would like to continue with
     the task. If yes, continue and if no, exit. The function can create an
@@ -108,9 +126,12 @@ def confirm_decision_response(additional_process=None):
     Args:
         additional_process: Union[str, None]
             options: "form", None
+        llm_format: bool
+            Use the llm to handle result formatting.
     """
 
     def function_collector(f):
+        @wraps(f)
         async def wrapper(class_obj: type, chat_choice: Choice):
             """
             Inner function to handle the views. First the confirm view and then
@@ -125,11 +146,20 @@ def confirm_decision_response(additional_process=None):
             """
             confirm_view = ConfirmView(class_obj=class_obj)
 
+            if llm_format:
+                prompt = (
+                    "ask if they are sure if they want to continue with the "
+                    "task"
+                )
+            else:
+                prompt = "Are you sure you want to continue?"
+
             responder = Responder(
                 class_obj.llm_handler,
                 chat_choice,
-                "ask if they are sure if they want to continue with the task",
+                prompt,
                 confirm_view,
+                llm_format=llm_format,
             )
             confirm_view.bot_message_obj = await responder.reply_to_message(
                 class_obj.message
@@ -167,6 +197,7 @@ def confirm_decision_response(additional_process=None):
                 class_obj.llm_handler,
                 chat_choice,
                 results,
+                llm_format=llm_format,
             )
             # only reply if there is an interaction from user
             if confirm_view.interaction is not None:
@@ -0,0 +1,111 @@
+from __future__ import annotations
+import re
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Class for an in-memory cache with a maximum size and time to live.
+    Least recently used entries are evicted first. Hits, misses and evictions
+    are counted in metrics under the cache name.
+
+    Attributes:
+        name: str
+        max_entries: int
+        ttl: float
+            Seconds before an entry expires unless it is set per entry.
+        entries: OrderedDict
+            key: (expires_at, value). Ordered from least to most recently
+            used.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Get value if it exists and has not expired.
+
+        Args:
+            key: Hashable
+
+        Returns:
+            Any
+                None if there is no valid entry.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            metrics.incr(f"{self.name}.miss")
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            metrics.incr(f"{self.name}.expired")
+            metrics.incr(f"{self.name}.miss")
+            return None
+
+        self.entries.move_to_end(key)
+        metrics.incr(f"{self.name}.hit")
+        return value
+
+    def set(
+        self, key: Hashable, value: Any, ttl: Optional[float] = None
+    ) -> None:
+        """
+        Add or replace entry and evict least recently used entries if the
+        cache is full.
+
+        Args:
+            key: Hashable
+            value: Any
+            ttl: Optional[float]
+                Overrides the cache's ttl for this entry.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            metrics.incr(f"{self.name}.evicted")
+        metrics.set_gauge(f"{self.name}.size", len(self.entries))
+
+    def clear(self) -> None:
+        self.entries.clear()
+        metrics.set_gauge(f"{self.name}.size", 0)
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Returns:
+            float
+        """
+        return metrics.ratio(f"{self.name}.hit", f"{self.name}.miss")
+
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """
+    Normalize user message so that messages that only differ in case,
+    whitespace or trailing punctuation are the same.
+
+    Args:
+        message: str
+
+    Returns:
+        str
+    """
+    return _whitespace.sub(" ", message.lower()).strip().rstrip(".!?")
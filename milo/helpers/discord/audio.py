@@ -0,0 +1,67 @@
+from __future__ import annotations
+from queue import Queue
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Union
+
+
+class AudioStream:
+    """
+    Class for a file-like object that can be used as a piped source for
+    FFmpeg audio in discord.py. Audio is fed from the event loop as it is
+    downloaded and read by the player in another thread.
+
+    Attributes:
+        chunks: Queue
+            Fed chunks. None marks the end of the stream.
+        buffer: bytes
+            Part of a chunk that was not read yet.
+        finished: bool
+    """
+
+    def __init__(self) -> None:
+        self.chunks: Queue[Union[bytes, None]] = Queue()
+        self.buffer: bytes = b""
+        self.finished: bool = False
+
+    def feed(self, data: bytes) -> None:
+        """
+        Add audio to the stream.
+
+        Args:
+            data: bytes
+        """
+        if data:
+            self.chunks.put(data)
+
+    def end(self) -> None:
+        """
+        Mark the end of the stream. Reading returns b"" once everything fed
+        has been read.
+        """
+        self.chunks.put(None)
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read up to size bytes. Blocks until there is data or the stream has
+        ended.
+
+        Args:
+            size: int
+
+        Returns:
+            bytes
+        """
+        while not self.buffer and not self.finished:
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.finished = True
+            else:
+                self.buffer = chunk
+
+        if size < 0 or size >= len(self.buffer):
+            data, self.buffer = self.buffer, b""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
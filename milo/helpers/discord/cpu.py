@@ -0,0 +1,93 @@
+from __future__ import annotations
+import os
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from discord import Client
+    from typing import Optional
+
+
+def process_cpu_time(pid: int) -> Optional[float]:
+    """
+    Get the CPU time used by a process from /proc.
+
+    Args:
+        pid: int
+
+    Returns:
+        Optional[float]
+            Seconds, None if the process is gone or /proc is not available.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # the command name can contain spaces, the fields after it can't
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = int(fields[11]) + int(fields[12])
+        return ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class CPUMonitor:
+    """
+    Class to measure the CPU used by this process and by the FFmpeg process
+    of every voice stream since the last report.
+
+    Attributes:
+        samples: dict[int, tuple[float, float]]
+            pid: (CPU seconds, monotonic time) at the last report.
+    """
+
+    def __init__(self) -> None:
+        self.samples: dict[int, tuple[float, float]] = dict()
+
+    def report(self, client: Client) -> dict:
+        """
+        Get CPU usage of the process and of each voice stream. Opus streams
+        and speech are only copied by FFmpeg; other streams are transcoded by
+        FFmpeg, so their FFmpeg processes show the cost of transcoding.
+
+        Args:
+            client: Client
+
+        Returns:
+            dict
+                process: Optional[float]
+                    Percent of one core, None on the first report.
+                streams: list[float]
+                    Percent of one core per FFmpeg process that was running
+                    at the last report too.
+        """
+        now = time.monotonic()
+        last = self.samples
+        # processes that ended are dropped
+        self.samples = dict()
+
+        def usage(pid: int, cpu_time: float) -> Optional[float]:
+            self.samples[pid] = (cpu_time, now)
+            if pid not in last or now <= last[pid][1]:
+                return None
+            return (cpu_time - last[pid][0]) / (now - last[pid][1]) * 100
+
+        process = usage(os.getpid(), time.process_time())
+
+        streams = list()
+        for voice_client in client.voice_clients:
+            # discord.py doesn't expose the FFmpeg process of a source
+            source = getattr(voice_client, "source", None)
+            pid = getattr(getattr(source, "_process", None), "pid", None)
+            if pid is None:
+                continue
+            cpu_time = process_cpu_time(pid)
+            if cpu_time is None:
+                continue
+
+            stream = usage(pid, cpu_time)
+            if stream is not None:
+                streams.append(stream)
+
+        return {"process": process, "streams": streams}
+
+
+cpu_monitor = CPUMonitor()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+import itertools
+import os
+import resource
+import sys
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from discord import Client
+    from typing import Iterable
+
+# objects measured per cache to estimate its size
+sample_size = 50
+_sized_types = (str, bytes, int, float, tuple, list, dict, set, frozenset)
+
+
+def approximate_size(obj: object) -> int:
+    """
+    Estimate the memory used by an object and the values it owns. Other
+    objects it points to, like its guild, are not counted since they are
+    shared.
+
+    Args:
+        obj: object
+
+    Returns:
+        int
+            Bytes.
+    """
+    size = sys.getsizeof(obj)
+
+    values = list()
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if hasattr(obj, name):
+                values.append(getattr(obj, name))
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+        values.extend(obj.__dict__.values())
+
+    for value in values:
+        if isinstance(value, _sized_types):
+            size += sys.getsizeof(value)
+    return size
+
+
+def estimate(objects: Iterable, count: int) -> dict:
+    """
+    Estimate the size of a cache from a sample of its objects.
+
+    Args:
+        objects: Iterable
+        count: int
+            Number of objects in the cache.
+
+    Returns:
+        dict
+    """
+    sample = list(itertools.islice(objects, sample_size))
+    if not sample:
+        return {"count": count, "bytes": 0}
+    average = sum(approximate_size(obj) for obj in sample) / len(sample)
+    return {"count": count, "bytes": int(average * count)}
+
+
+def process_rss() -> int:
+    """
+    Get memory used by this process in bytes. Falls back to the peak when
+    /proc is not available.
+
+    Returns:
+        int
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cache_memory_report(client: Client) -> dict:
+    """
+    Count the objects in each of discord.py's caches and estimate the
+    memory they use.
+
+    Args:
+        client: Client
+
+    Returns:
+        dict
+            cache name: {"count": int, "bytes": int}
+    """
+    guilds = client.guilds
+
+    def chain(attribute: str) -> Iterable:
+        return itertools.chain.from_iterable(
+            getattr(guild, attribute) for guild in guilds
+        )
+
+    def voice_states() -> Iterable:
+        for guild in guilds:
+            for channel in guild.voice_channels + guild.stage_channels:
+                yield from channel.voice_states.values()
+
+    return {
+        "guilds": estimate(guilds, len(guilds)),
+        "members": estimate(
+            chain("members"), sum(len(g.members) for g in guilds)
+        ),
+        "users": estimate(client.users, len(client.users)),
+        "channels": estimate(
+            chain("channels"), sum(len(g.channels) for g in guilds)
+        ),
+        "threads": estimate(
+            chain("threads"), sum(len(g.threads) for g in guilds)
+        ),
+        "roles": estimate(chain("roles"), sum(len(g.roles) for g in guilds)),
+        "voice_states": estimate(
+            voice_states(), sum(1 for _ in voice_states())
+        ),
+        "messages": estimate(
+            client.cached_messages, len(client.cached_messages)
+        ),
+        "emojis": estimate(client.emojis, len(client.emojis)),
+        "stickers": estimate(client.stickers, len(client.stickers)),
+        "process": {"count": 1, "bytes": process_rss()},
+    }
@@ -27,7 +27,7 @@ class ConfirmView(ui.View):
             view can exit in multiple ways. For example, it can exit when the
             user clicks on Continue or it can simply timeout.
             Options:
-              'premature', 'continued', 'cancelled', 'not_author', 'error'
+              'continued', 'cancelled', 'not_author', 'error'
     """
 
     def __init__(
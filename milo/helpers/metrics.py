@@ -0,0 +1,112 @@
+from __future__ import annotations
+from asyncio import sleep
+from typing import TYPE_CHECKING
+from milo.globals import app_logger
+
+if TYPE_CHECKING:
+    from typing import Union
+
+
+class Metrics:
+    """
+    Class to keep simple in-process counters and timings so the effect of
+    caches, queues and fast paths can be seen in the logs.
+
+    Attributes:
+        counters: dict[str, int]
+        timings: dict[str, list]
+            name: [count, total, max]
+        gauges: dict[str, Union[int, float]]
+    """
+
+    def __init__(self) -> None:
+        self.counters: dict[str, int] = dict()
+        self.timings: dict[str, list] = dict()
+        self.gauges: dict[str, Union[int, float]] = dict()
+
+    def incr(self, name: str, value: int = 1) -> None:
+        """
+        Increase counter.
+
+        Args:
+            name: str
+            value: int
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Record a timing (or any other measured value).
+
+        Args:
+            name: str
+            value: float
+        """
+        timing = self.timings.get(name)
+        if timing is None:
+            self.timings[name] = [1, value, value]
+        else:
+            timing[0] += 1
+            timing[1] += value
+            if value > timing[2]:
+                timing[2] = value
+
+    def set_gauge(self, name: str, value: Union[int, float]) -> None:
+        """
+        Set the current value of something, for example a queue depth.
+
+        Args:
+            name: str
+            value: Union[int, float]
+        """
+        self.gauges[name] = value
+
+    def ratio(self, hits: str, misses: str) -> float:
+        """
+        Get hit rate between two counters.
+
+        Args:
+            hits: str
+            misses: str
+
+        Returns:
+            float
+        """
+        hit = self.counters.get(hits, 0)
+        total = hit + self.counters.get(misses, 0)
+        return hit / total if total else 0.0
+
+    def snapshot(self) -> dict:
+        """
+        Get a copy of all metrics.
+
+        Returns:
+            dict
+        """
+        timings = dict()
+        for name, (count, total, maximum) in self.timings.items():
+            timings[name] = {
+                "count": count,
+                "avg": total / count,
+                "max": maximum,
+            }
+
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "timings": timings,
+        }
+
+    async def report_periodically(self, interval: int) -> None:
+        """
+        Log a snapshot of all metrics every interval seconds.
+
+        Args:
+            interval: int
+        """
+        while True:
+            await sleep(interval)
+            app_logger.info(f"metrics: {self.snapshot()}")
+
+
+metrics = Metrics()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Union
+
+
+# statuses returned by actions and decorators that are not readable as is
+statuses = {
+    "not_admin": "You need admin privileges to do that.",
+    "continued": "Done.",
+    "cancelled": "Cancelled.",
+    "not_author": "Only the person who asked can do that.",
+    "error": "Something went wrong.",
+}
+
+
+def render_status(status: Union[str, None]) -> str:
+    """
+    Render a short status like 'nothing playing' as a sentence.
+
+    Args:
+        status: Union[str, None]
+
+    Returns:
+        str
+    """
+    if not status:
+        return "Done."
+    if status in statuses:
+        return statuses[status]
+
+    status = status[0].upper() + status[1:]
+    if status[-1] not in ".!?":
+        status = f"{status}."
+    return status
+
+
+def render_title(title: str) -> str:
+    """
+    Render the title of something that started playing.
+
+    Args:
+        title: str
+
+    Returns:
+        str
+    """
+    return f"Now playing: **{title}**"
+
+
+def render_queued(query: str, position: int) -> str:
+    """
+    Render a track that was added to the queue.
+
+    Args:
+        query: str
+        position: int
+
+    Returns:
+        str
+    """
+    return f"Queued **{query}** at position {position}."
+
+
+def render_queue(playing: Union[str, None], queue: list[str]) -> str:
+    """
+    Render what is playing and the numbered tracks after it.
+
+    Args:
+        playing: Union[str, None]
+        queue: list[str]
+
+    Returns:
+        str
+    """
+    if playing is None and not queue:
+        return "The queue is empty."
+
+    lines = [f"Now playing: **{playing}**"] if playing else list()
+    lines.extend(f"{i}. {title}" for i, title in enumerate(queue, 1))
+    return "\n".join(lines)
+
+
+def render_table(rows: dict) -> str:
+    """
+    Render dict as a table in a codeblock. Values that are dicts with a value
+    and a unit (like Settings.fields_extra_data) are shown in one column.
+
+    Args:
+        rows: dict
+
+    Returns:
+        str
+    """
+    if not rows:
+        return "Nothing to show."
+
+    cells = list()
+    for key, value in rows.items():
+        if isinstance(value, dict) and "value" in value:
+            value = f"{value['value']} {value.get('unit', '')}".rstrip()
+        cells.append((str(key), str(value)))
+
+    width = max(len(key) for key, value in cells)
+    lines = [f"{key.ljust(width)} | {value}" for key, value in cells]
+    return "```\n" + "\n".join(lines) + "\n```"
+
+
+# result type: renderer called with the other keys of the result
+result_renderers = {
+    "playing": render_title,
+    "queued": render_queued,
+    "queue": render_queue,
+}
+
+
+def render_results(results: Union[str, dict, None]) -> str:
+    """
+    Render results from an action. Dicts with a type key listed in
+    result_renderers use that renderer, other dicts are shown as a table.
+
+    Args:
+        results: Union[str, dict, None]
+
+    Returns:
+        str
+    """
+    if isinstance(results, dict):
+        renderer = result_renderers.get(results.get("type"))
+        if renderer is None:
+            return render_table(results)
+        fields = {k: v for k, v in results.items() if k != "type"}
+        return renderer(**fields)
+    if results is None or isinstance(results, str):
+        return render_status(results)
+    return str(results)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+from asyncio import create_task, shield, wait_for
+from typing import TYPE_CHECKING
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from asyncio import Task
+    from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+class SingleFlight:
+    """
+    Class to merge identical calls that run at the same time. The first call
+    for a key runs and every other call for that key while it is running
+    waits for the same result (or error).
+
+    Attributes:
+        name: str
+            Used for metrics.
+        calls: dict[Hashable, Task]
+            Calls that are running.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls: dict[Hashable, Task] = dict()
+
+    async def do(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Run factory or wait for the call already running for key.
+
+        Args:
+            key: Hashable
+            factory: Callable[[], Awaitable[Any]]
+            timeout: Optional[float]
+                How long this caller waits. The call keeps running for other
+                callers if this one times out or is cancelled.
+
+        Raises:
+            TimeoutError
+
+        Returns:
+            Any
+        """
+        task = self.calls.get(key)
+        if task is None:
+            task = create_task(factory())
+            self.calls[key] = task
+            task.add_done_callback(lambda t: self.forget(key, t))
+            metrics.incr(f"{self.name}.calls")
+        else:
+            metrics.incr(f"{self.name}.deduplicated")
+
+        return await wait_for(shield(task), timeout)
+
+    def forget(self, key: Hashable, task: Task) -> None:
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # nobody may be waiting anymore. retrieve the error so it is not
+        # logged as never retrieved
+        if not task.cancelled():
+            task.exception()
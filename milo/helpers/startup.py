@@ -0,0 +1,60 @@
+from __future__ import annotations
+import time
+from milo.globals import app_logger
+from milo.helpers.metrics import metrics
+
+
+class StartupTimer:
+    """
+    Class to time the phases of starting the bot. Phases can overlap, for
+    example the database is set up while logging in.
+
+    Attributes:
+        started: float
+            perf_counter when this module was imported. main.py imports it
+            first so the imports phase covers everything else.
+        phases: dict[str, list]
+            phase: [start, end]. end is None while the phase runs.
+        reported: bool
+    """
+
+    def __init__(self) -> None:
+        self.started: float = time.perf_counter()
+        self.phases: dict[str, list] = {"imports": [self.started, None]}
+        self.reported: bool = False
+
+    def start(self, phase: str) -> None:
+        self.phases[phase] = [time.perf_counter(), None]
+
+    def end(self, phase: str) -> None:
+        if self.phases[phase][1] is not None:
+            return
+        self.phases[phase][1] = time.perf_counter()
+        metrics.observe(f"startup.{phase}", self.duration(phase))
+
+    def duration(self, phase: str) -> float:
+        start, end = self.phases[phase]
+        return (end or time.perf_counter()) - start
+
+    def report(self) -> None:
+        """
+        Log when each phase started and how long it took, relative to the
+        start of the process. Only logged the first time the bot is ready.
+        """
+        if self.reported:
+            return
+        self.reported = True
+
+        total = time.perf_counter() - self.started
+        lines = [f"startup took {total:.2f}s"]
+        for phase, (start, end) in self.phases.items():
+            lines.append(
+                f"  {phase}: +{start - self.started:.2f}s "
+                f"took {self.duration(phase):.2f}s"
+                + ("" if end else " (running)")
+            )
+        metrics.observe("startup.total", total)
+        app_logger.info("\n".join(lines))
+
+
+startup_timer = StartupTimer()
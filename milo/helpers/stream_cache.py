@@ -0,0 +1,303 @@
+from __future__ import annotations
+import re
+import time
+from asyncio import create_task, to_thread
+from peewee import PeeweeException
+from urllib.parse import parse_qs, urlsplit
+from typing import TYPE_CHECKING
+from milo.globals import (
+    app_logger,
+    stream_cache_default_ttl,
+    stream_cache_expiry_margin,
+    stream_cache_max_entries,
+    stream_cache_persist,
+    stream_cache_query_ttl,
+)
+from milo.handler.database import StreamInfo, StreamQuery
+from milo.helpers.cache import TTLCache
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from asyncio import Task
+    from typing import Optional
+
+_path_expire = re.compile(r"/expire/(\d+)")
+_youtube_id = re.compile(
+    r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)"
+    r"|youtu\.be/)([\w-]{11})"
+)
+
+
+def stream_url_expiry(url: str) -> Optional[float]:
+    """
+    Get the expiry embedded in a signed stream URL, like the expire parameter
+    of YouTube's stream URLs.
+
+    Args:
+        url: str
+
+    Returns:
+        Optional[float]
+            Unix time or None if the URL has no expiry.
+    """
+    parts = urlsplit(url)
+    values = parse_qs(parts.query).get("expire")
+    if values and values[0].isdigit():
+        return float(values[0])
+
+    match = _path_expire.search(parts.path)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def youtube_stream_id(url: str) -> Optional[str]:
+    """
+    Get the stream id of a YouTube video URL without extracting it.
+
+    Args:
+        url: str
+
+    Returns:
+        Optional[str]
+    """
+    match = _youtube_id.search(url)
+    return f"youtube:{match.group(1)}" if match else None
+
+
+class StreamCache:
+    """
+    Class to cache resolved streams so repeat plays skip extraction. Queries
+    map to a stream id and stream ids map to the title, duration and audio
+    URL, so different queries for the same video share one entry.
+
+    Entries are kept in memory with LRU bounds and, if persist is set, in
+    SQLite so they survive restarts. The database is only used in threads.
+
+    Attributes:
+        queries: TTLCache
+            query key: stream id
+        streams: TTLCache
+            stream id: {"url", "title", "duration", "codec", "id"}
+        query_ttl: float
+        default_ttl: float
+            Used for stream URLs without an expiry.
+        expiry_margin: float
+        max_entries: int
+        persist: bool
+        stores: int
+            Number of stores since the database was last pruned.
+        tasks: set[Task]
+            Stores running in threads.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        query_ttl: float,
+        default_ttl: float,
+        expiry_margin: float,
+        persist: bool,
+    ) -> None:
+        self.queries = TTLCache("stream_cache.queries", max_entries, query_ttl)
+        self.streams = TTLCache(
+            "stream_cache.streams", max_entries, default_ttl
+        )
+        self.query_ttl = query_ttl
+        self.default_ttl = default_ttl
+        self.expiry_margin = expiry_margin
+        self.max_entries = max_entries
+        self.persist = persist
+        self.stores: int = 0
+        self.tasks: set[Task] = set()
+
+    def expires_at(self, info: dict) -> float:
+        """
+        Get when the stream should stop being used. The URL has to stay
+        valid while the song plays since FFmpeg can reconnect to it.
+
+        Args:
+            info: dict
+
+        Returns:
+            float
+                Unix time.
+        """
+        expiry = stream_url_expiry(info["url"])
+        if expiry is None:
+            return time.time() + self.default_ttl
+        margin = max(self.expiry_margin, info.get("duration") or 0)
+        return expiry - margin
+
+    async def get(
+        self, query_key: str, stream_id: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        Get the stream for a query. Entries that are not in memory are
+        loaded from the database in a thread, since SQLite can wait for
+        another process to release the database.
+
+        Args:
+            query_key: str
+            stream_id: Optional[str]
+                Skips the query lookup if the stream id is already known.
+
+        Returns:
+            Optional[dict]
+        """
+        if stream_id is None:
+            stream_id = self.queries.get(query_key)
+        info = self.streams.get(stream_id) if stream_id is not None else None
+        if info is not None or not self.persist:
+            return info
+
+        now = time.time()
+        query_row, info_row = await to_thread(self.load, query_key, stream_id)
+        if query_row is not None:
+            metrics.incr("stream_cache.queries.loaded")
+            stream_id, expires_at = query_row
+            self.queries.set(query_key, stream_id, ttl=expires_at - now)
+        if info_row is None:
+            return None
+
+        metrics.incr("stream_cache.streams.loaded")
+        info, expires_at = info_row
+        self.streams.set(info["id"], info, ttl=expires_at - now)
+        return info
+
+    def set(self, query_key: str, info: dict) -> None:
+        """
+        Add resolved stream. It is saved to the database in the background.
+
+        Args:
+            query_key: str
+            info: dict
+                Must have a stream id.
+        """
+        now = time.time()
+        stream_id = info["id"]
+        expires_at = self.expires_at(info)
+        if expires_at <= now:
+            metrics.incr("stream_cache.too_short")
+            return
+
+        self.queries.set(query_key, stream_id)
+        self.streams.set(stream_id, info, ttl=expires_at - now)
+
+        if self.persist:
+            self.stores += 1
+            prune = self.stores >= self.max_entries
+            if prune:
+                self.stores = 0
+            task = create_task(
+                to_thread(self.store, query_key, info, expires_at, prune)
+            )
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def load(
+        self, query_key: str, stream_id: Optional[str]
+    ) -> tuple[Optional[tuple[str, float]], Optional[tuple[dict, float]]]:
+        """
+        Read a query and its stream from the database. Blocks.
+
+        Args:
+            query_key: str
+            stream_id: Optional[str]
+                The query is only read if this is None.
+
+        Returns:
+            tuple[Optional[tuple[str, float]], Optional[tuple[dict, float]]]
+                (stream id, expires at) of the query and (info, expires at)
+                of the stream, None if not found or expired.
+        """
+        now = time.time()
+        query_row = None
+        try:
+            if stream_id is None:
+                row = StreamQuery.get_or_none(
+                    (StreamQuery.query == query_key)
+                    & (StreamQuery.expires_at > now)
+                )
+                if row is None:
+                    return None, None
+                stream_id = row.stream_id
+                query_row = (row.stream_id, row.expires_at)
+
+            row = StreamInfo.get_or_none(
+                (StreamInfo.stream_id == stream_id)
+                & (StreamInfo.expires_at > now)
+            )
+        except PeeweeException as e:
+            app_logger.error(e)
+            return None, None
+        if row is None:
+            return query_row, None
+
+        info = {
+            "url": row.url,
+            "title": row.title,
+            "duration": row.duration,
+            "codec": row.codec,
+            "id": row.stream_id,
+        }
+        return query_row, (info, row.expires_at)
+
+    def store(
+        self, query_key: str, info: dict, expires_at: float, prune: bool
+    ) -> None:
+        """
+        Save stream to the database. Blocks.
+
+        Args:
+            query_key: str
+            info: dict
+            expires_at: float
+            prune: bool
+                Prune the database after saving. Done every max_entries
+                stores.
+        """
+        try:
+            StreamQuery.replace(
+                query=query_key,
+                stream_id=info["id"],
+                expires_at=time.time() + self.query_ttl,
+            ).execute()
+            StreamInfo.replace(
+                stream_id=info["id"],
+                title=info["title"],
+                url=info["url"],
+                duration=info.get("duration"),
+                codec=info.get("codec"),
+                expires_at=expires_at,
+            ).execute()
+            if prune:
+                self.prune()
+        except PeeweeException as e:
+            app_logger.error(e)
+
+    def prune(self) -> None:
+        """
+        Delete expired rows and keep at most max_entries of each table,
+        the ones that expire last.
+        """
+        now = time.time()
+        for model in (StreamQuery, StreamInfo):
+            model.delete().where(model.expires_at <= now).execute()
+            keep = (
+                model.select(model._meta.primary_key)
+                .order_by(model.expires_at.desc())
+                .limit(self.max_entries)
+            )
+            model.delete().where(
+                model._meta.primary_key.not_in(keep)
+            ).execute()
+
+
+stream_cache = StreamCache(
+    stream_cache_max_entries,
+    stream_cache_query_ttl,
+    stream_cache_default_ttl,
+    stream_cache_expiry_margin,
+    stream_cache_persist,
+)
@@ -0,0 +1,236 @@
+from __future__ import annotations
+import hashlib
+import importlib
+import json
+import pkgutil
+from typing import TYPE_CHECKING
+from milo.globals import parent_mod
+
+if TYPE_CHECKING:
+    from discord import Message
+    from openai.types.chat.chat_completion import Choice
+    from typing import Callable, Coroutine, Optional, Union
+    from milo.handler.discord import DiscordHandler
+    from milo.handler.llm import LLMHandler
+
+
+class Tool:
+    """
+    Class to hold a single function that can be chosen by the llm.
+
+    Attributes:
+        name: str
+            Name sent to OpenAI. Format: <module>_<class>_<function>
+        module_name: str
+        class_name: str
+        func_name: str
+        schema: dict
+            Tool description used with OpenAI function calling.
+        class_obj: Union[type, None]
+            Resolved when the registry is built.
+        func: Union[Callable, None]
+            Resolved when the registry is built.
+    """
+
+    def __init__(
+        self,
+        module_name: str,
+        class_name: str,
+        func_name: str,
+        description: str,
+        parameters: dict,
+    ) -> None:
+        self.module_name = module_name
+        self.class_name = class_name
+        self.func_name = func_name
+        self.name = (
+            f"{module_name.rsplit('.', 1)[-1]}_{class_name}_{func_name}"
+        )
+        self.schema = {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": description,
+                "parameters": parameters,
+            },
+        }
+        self.class_obj: Union[type, None] = None
+        self.func: Union[Callable, None] = None
+
+    def resolve(self) -> None:
+        """
+        Look up the class and function the tool points to.
+        """
+        module = importlib.import_module(self.module_name)
+        self.class_obj = getattr(module, self.class_name)
+        self.func = getattr(self.class_obj, self.func_name)
+
+    def __call__(
+        self,
+        dc_handler: DiscordHandler,
+        message: Message,
+        args: dict,
+        llm_handler: LLMHandler,
+        chat_choice: Optional[Choice],
+    ) -> Coroutine:
+        """
+        Create the class object and call the function with it.
+
+        Args:
+            dc_handler: DiscordHandler
+            message: Message
+            args: dict
+            llm_handler: LLMHandler
+            chat_choice: Optional[Choice]
+
+        Returns:
+            Coroutine
+        """
+        class_obj = self.class_obj(dc_handler, message, args, llm_handler)
+        return self.func(class_obj, chat_choice)
+
+
+class ToolRegistry:
+    """
+    Class to collect tools declared with the tool decorator. Building the
+    registry imports every module in parent_mod once and freezes the schemas
+    and the name to tool lookup so nothing has to be rebuilt per message.
+
+    Attributes:
+        pending: list[Tool]
+            Tools declared but not yet resolved.
+        tools: dict[str, Tool]
+        schemas: tuple[dict]
+            Do not modify. Shared by every request to OpenAI.
+        version: str
+            Hash of the schemas. Changes whenever a tool changes.
+        built: bool
+    """
+
+    def __init__(self) -> None:
+        self.pending: list[Tool] = list()
+        self.tools: dict[str, Tool] = dict()
+        self._schemas: tuple[dict] = tuple()
+        self._version: str = ""
+        self.built: bool = False
+
+    def register(self, tool: Tool) -> None:
+        """
+        Add tool to be resolved on build.
+
+        Args:
+            tool: Tool
+
+        Raises:
+            ValueError
+        """
+        if self.built:
+            raise ValueError(
+                f"Tool '{tool.name}' registered after registry was built."
+            )
+        self.pending.append(tool)
+
+    def build(self) -> None:
+        """
+        Import all mods, resolve every tool and freeze the schemas. Only runs
+        once.
+
+        Raises:
+            ValueError
+        """
+        if self.built:
+            return
+
+        package = importlib.import_module(parent_mod)
+        for module_info in pkgutil.iter_modules(package.__path__):
+            importlib.import_module(f"{parent_mod}.{module_info.name}")
+
+        tools = dict()
+        for tool in self.pending:
+            if tool.name in tools:
+                raise ValueError(f"Tool '{tool.name}' registered twice.")
+            tool.resolve()
+            tools[tool.name] = tool
+
+        self.tools = tools
+        self._schemas = tuple(tool.schema for tool in tools.values())
+        self._version = hashlib.sha1(
+            json.dumps(self._schemas, sort_keys=True).encode()
+        ).hexdigest()[:12]
+        self.pending = list()
+        self.built = True
+
+    @property
+    def schemas(self) -> tuple[dict]:
+        """
+        Tools for use with OpenAI function calling.
+
+        Returns:
+            tuple[dict]
+        """
+        self.build()
+        return self._schemas
+
+    @property
+    def version(self) -> str:
+        """
+        Returns:
+            str
+        """
+        self.build()
+        return self._version
+
+    def get(self, name: str) -> Union[Tool, None]:
+        """
+        Get tool by name.
+
+        Args:
+            name: str
+
+        Returns:
+            Union[Tool, None]
+        """
+        self.build()
+        return self.tools.get(name)
+
+
+tool_registry = ToolRegistry()
+
+
+def tool(
+    description: str,
+    properties: Optional[dict] = None,
+    required: Optional[list[str]] = None,
+):
+    """
+    Decorator: declares a class method as a tool the llm can choose. Has to be
+    the outermost decorator.
+
+    Args:
+        description: str
+        properties: Optional[dict]
+            JSON schema properties for the function arguments.
+        required: Optional[list[str]]
+            Defaults to all properties.
+    """
+    if properties is None:
+        properties = dict()
+    if required is None:
+        required = list(properties)
+
+    parameters = {
+        "type": "object",
+        "properties": properties,
+        "additionalProperties": False,
+    }
+    if required:
+        parameters["required"] = required
+
+    def function_collector(f):
+        class_name, func_name = f.__qualname__.split(".")[-2:]
+        tool_registry.register(
+            Tool(f.__module__, class_name, func_name, description, parameters)
+        )
+        return f
+
+    return function_collector
@@ -0,0 +1,235 @@
+from __future__ import annotations
+import hashlib
+import os
+import tempfile
+import time
+from asyncio import create_task, to_thread
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+from milo.globals import (
+    app_logger,
+    tts_cache_dir,
+    tts_cache_max_bytes,
+    tts_cache_rescan_interval,
+)
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from asyncio import Task
+    from typing import Iterator, Optional, Union
+
+
+class TTSCache:
+    """
+    Class for a content-addressed cache of text-to-speech audio on disk.
+    Files are named after a hash of the text, voice, model and format. The
+    least recently used files are deleted when the cache is over max_bytes.
+
+    Shard processes share the directory. The files written by the others
+    are counted when the directory is scanned again, which happens in a
+    thread once the cache is over max_bytes or rescan_interval has passed.
+
+    Attributes:
+        directory: str
+        max_bytes: int
+        rescan_interval: float
+        files: OrderedDict
+            path: size in bytes. Ordered from least to most recently used.
+            Loaded from disk on first use.
+        size: int
+            Total bytes on disk.
+        scanned_at: float
+            monotonic time of the last scan.
+        trimming: Optional[Task]
+            Scan and eviction running in the background.
+    """
+
+    def __init__(
+        self, directory: str, max_bytes: int, rescan_interval: float
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self.files: Union[OrderedDict, None] = None
+        self.size: int = 0
+        self.scanned_at: float = 0.0
+        self.trimming: Optional[Task] = None
+
+    def load(self) -> None:
+        """
+        Load existing files from disk on first use.
+        """
+        if self.files is None:
+            self.set_files(self.scan())
+
+    def scan(self) -> list[tuple[str, int]]:
+        """
+        Read the files on disk. Unfinished temp files from a previous run are
+        deleted. Recent ones may still be written by another shard process.
+        Blocks.
+
+        Returns:
+            list[tuple[str, int]]
+                (path, size) from least to most recently used.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        entries = list()
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".tmp"):
+                    if stat.st_mtime < time.time() - 3600:
+                        os.remove(entry.path)
+                    continue
+            except FileNotFoundError:
+                # evicted by another shard process
+                continue
+            entries.append((stat.st_mtime, entry.path, stat.st_size))
+
+        return [(path, size) for mtime, path, size in sorted(entries)]
+
+    def set_files(self, files: list[tuple[str, int]]) -> None:
+        self.files = OrderedDict(files)
+        self.size = sum(self.files.values())
+        self.scanned_at = time.monotonic()
+        self.update_gauges()
+
+    def path_for(
+        self, text: str, voice: str, model: str, extension: str
+    ) -> str:
+        """
+        Get path in cache for the audio.
+
+        Args:
+            text: str
+            voice: str
+            model: str
+            extension: str
+
+        Returns:
+            str
+        """
+        key = f"{model}\0{voice}\0{extension}\0{text}"
+        key = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def get(self, path: str) -> bool:
+        """
+        Check if audio is cached and mark it as recently used.
+
+        Args:
+            path: str
+
+        Returns:
+            bool
+        """
+        self.load()
+
+        if path not in self.files:
+            # another shard process may have created it
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                metrics.incr("tts_cache.miss")
+                return False
+            self.files[path] = size
+            self.size += size
+            self.update_gauges()
+
+        self.files.move_to_end(path)
+        try:
+            # mtime keeps the order across restarts
+            os.utime(path)
+        except FileNotFoundError:
+            self.size -= self.files.pop(path)
+            self.update_gauges()
+            metrics.incr("tts_cache.miss")
+            return False
+
+        metrics.incr("tts_cache.hit")
+        return True
+
+    @contextmanager
+    def writer(self, path: str) -> Iterator[str]:
+        """
+        Context manager that gives a temp path to write the audio to. The file
+        is moved to path once the block finishes without an error so a file
+        in the cache is never half written.
+
+        Args:
+            path: str
+
+        Yields:
+            str
+        """
+        self.load()
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            yield temp_path
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        size = os.path.getsize(path)
+        self.size += size - self.files.pop(path, 0)
+        self.files[path] = size
+        self.update_gauges()
+
+        rescan = time.monotonic() - self.scanned_at > self.rescan_interval
+        if self.size > self.max_bytes or rescan:
+            if self.trimming is None or self.trimming.done():
+                self.trimming = create_task(self.trim())
+
+    async def trim(self) -> None:
+        """
+        Scan the directory again and delete least recently used files until
+        the cache is within max_bytes. Disk access runs in threads.
+        """
+        self.set_files(await to_thread(self.scan))
+        evicted = self.evict()
+        if evicted:
+            await to_thread(self.delete, evicted)
+
+    def evict(self) -> list[str]:
+        """
+        Remove least recently used files from the cache until it is within
+        max_bytes. The most recent file is always kept.
+
+        Returns:
+            list[str]
+                Paths of the files to delete.
+        """
+        evicted = list()
+        while self.size > self.max_bytes and len(self.files) > 1:
+            path, size = self.files.popitem(last=False)
+            self.size -= size
+            evicted.append(path)
+            metrics.incr("tts_cache.evicted")
+        self.update_gauges()
+        return evicted
+
+    @staticmethod
+    def delete(paths: list[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                app_logger.error(e)
+
+    def update_gauges(self) -> None:
+        metrics.set_gauge("tts_cache.bytes", self.size)
+        metrics.set_gauge("tts_cache.files", len(self.files))
+
+
+tts_cache = TTSCache(
+    tts_cache_dir, tts_cache_max_bytes, tts_cache_rescan_interval
+)
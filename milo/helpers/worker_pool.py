@@ -0,0 +1,92 @@
+from __future__ import annotations
+import time
+from asyncio import TimeoutError, get_running_loop, wait_for
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Optional
+
+
+class WorkerPool:
+    """
+    Class to run blocking functions on a bounded pool of threads so they
+    neither block the event loop nor take every thread of the default
+    executor. Jobs wait in a FIFO queue when all workers are busy.
+
+    Threads can't be stopped. A job that times out before it started is
+    dropped; one that already started finishes in the background and its
+    result is thrown away.
+
+    Attributes:
+        name: str
+            Used for metrics and thread names.
+        workers: int
+        executor: Optional[ThreadPoolExecutor]
+            Created on first use.
+        pending: int
+            Jobs queued or running that are still waited for.
+    """
+
+    def __init__(self, name: str, workers: int) -> None:
+        self.name = name
+        self.workers = workers
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pending: int = 0
+
+    async def run(
+        self, func: Callable, *args, timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Run func(*args) on a worker.
+
+        Args:
+            func: Callable
+            timeout: Optional[float]
+                Seconds from queueing until the result is given up on.
+
+        Raises:
+            TimeoutError
+
+        Returns:
+            Any
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix=self.name
+            )
+
+        queued_at = time.perf_counter()
+        times: dict[str, float] = dict()
+
+        def job() -> Any:
+            times["started"] = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                times["finished"] = time.perf_counter()
+
+        self.pending += 1
+        metrics.set_gauge(f"{self.name}.pending", self.pending)
+        future = get_running_loop().run_in_executor(self.executor, job)
+        try:
+            # cancelling a job that has not started keeps it from running
+            return await wait_for(future, timeout)
+        except TimeoutError:
+            metrics.incr(f"{self.name}.timeouts")
+            if "started" not in times:
+                metrics.incr(f"{self.name}.dropped")
+            raise
+        finally:
+            self.pending -= 1
+            metrics.set_gauge(f"{self.name}.pending", self.pending)
+            if "started" in times:
+                metrics.observe(
+                    f"{self.name}.queue_wait", times["started"] - queued_at
+                )
+            if "finished" in times:
+                metrics.observe(
+                    f"{self.name}.run_time",
+                    times["finished"] - times["started"],
+                )
@@ -0,0 +1,190 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from typing import TYPE_CHECKING
+from milo.globals import (
+    app_logger,
+    audio_extraction_timeout,
+    ydl_cookie_file,
+    ydl_cookie_save_interval,
+)
+from milo.helpers.metrics import metrics
+
+if TYPE_CHECKING:
+    from typing import Optional
+    from yt_dlp import YoutubeDL
+
+
+class YoutubeDLCache:
+    """
+    Class to reuse YoutubeDL instances. Creating one sets up its extractors,
+    loads the cookie file and opens HTTP connections, which is most of the
+    cost of a short extraction.
+
+    YoutubeDL is not thread safe, so every thread gets its own instance of
+    each profile. The extraction pool's threads live as long as the process,
+    so this is one instance per worker and profile.
+
+    Cookies YouTube refreshes are saved to the cookie file at most every
+    save_interval seconds. Instances are replaced when the file is changed
+    by anything else, like a newly exported file.
+
+    Attributes:
+        cookie_file: str
+        save_interval: float
+        profiles: Optional[dict[str, dict]]
+            profile: yt-dlp options. Built on first use.
+        local: threading.local
+            instances: dict of profile: (cookie version, YoutubeDL)
+        lock: threading.Lock
+            Held while the cookie file is read or written.
+        saved_at: float
+            monotonic time of the last save.
+        saved_mtime: Optional[float]
+            mtime of the file after the last save.
+        saved_version: Optional[float]
+            Cookie version the last save was made over. Saves don't change
+            the version, so they don't replace instances.
+    """
+
+    def __init__(self, cookie_file: str, save_interval: float) -> None:
+        self.cookie_file = cookie_file
+        self.save_interval = save_interval
+        self.profiles: Optional[dict[str, dict]] = None
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.saved_at: float = time.monotonic()
+        self.saved_mtime: Optional[float] = None
+        self.saved_version: Optional[float] = None
+
+    def build_profiles(self) -> dict[str, dict]:
+        """
+        Options to be used with yt-dlp. The proxy profile is for sources
+        other than YouTube, the direct one for YouTube.
+
+        Returns:
+            dict[str, dict]
+        """
+        load_dotenv()
+
+        options = {
+            "verbose": False,
+            "geo-bypass": True,
+            # opus can be played without transcoding
+            "format": "bestaudio[acodec=opus]/bestaudio/best",
+            "quiet": True,
+            "noplaylist": True,
+            "playlist_items": "1",
+            "extractaudio": True,
+            "audio-format": "mp3",
+            "postprocessors": [
+                {
+                    "key": "FFmpegExtractAudio",
+                    "preferredcodec": "mp3",
+                    "preferredquality": "192",
+                }
+            ],
+            "nocheckcertificate": True,
+            "cookiefile": self.cookie_file,
+            # an extraction that timed out keeps its worker until it ends
+            "socket_timeout": audio_extraction_timeout,
+            "skip_download": True,
+            "ignore-errors": True,
+        }
+        return {
+            "proxy": {**options, "proxy": os.getenv("PROXY")},
+            "direct": options,
+        }
+
+    def cookie_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.cookie_file).st_mtime
+        except OSError:
+            return None
+
+    def cookie_version(self) -> Optional[float]:
+        mtime = self.cookie_mtime()
+        if mtime is not None and mtime == self.saved_mtime:
+            return self.saved_version
+        return mtime
+
+    def get(self, profile: str) -> YoutubeDL:
+        """
+        Get this thread's instance of profile.
+
+        Args:
+            profile: str
+                "proxy" or "direct"
+
+        Returns:
+            YoutubeDL
+        """
+        # yt-dlp is slow to import and only needed once something is played
+        from yt_dlp import YoutubeDL
+
+        if self.profiles is None:
+            self.profiles = self.build_profiles()
+        instances = getattr(self.local, "instances", None)
+        if instances is None:
+            instances = self.local.instances = dict()
+
+        version = self.cookie_version()
+        cached = instances.get(profile)
+        if cached is not None:
+            cached_version, ydl = cached
+            if cached_version == version:
+                metrics.incr("ytdl.reused")
+                return ydl
+            metrics.incr("ytdl.cookie_reloads")
+            self.retire(ydl)
+
+        # YoutubeDL keeps the dict. retire changes it
+        ydl = YoutubeDL(dict(self.profiles[profile]))
+        with self.lock:
+            # cookies are loaded on first use. not while a save writes them
+            ydl.cookiejar
+        instances[profile] = (version, ydl)
+        metrics.incr("ytdl.created")
+        return ydl
+
+    def save_cookies(self, ydl: YoutubeDL) -> None:
+        """
+        Save the cookies of instance if save_interval has passed since the
+        last save. Called after extracting.
+
+        Args:
+            ydl: YoutubeDL
+        """
+        if time.monotonic() - self.saved_at < self.save_interval:
+            return
+
+        with self.lock:
+            if time.monotonic() - self.saved_at < self.save_interval:
+                return
+            self.saved_at = time.monotonic()
+            version = self.cookie_version()
+            try:
+                ydl.cookiejar.save()
+            except OSError as e:
+                app_logger.error(e)
+                return
+            self.saved_mtime = self.cookie_mtime()
+            self.saved_version = version
+        metrics.incr("ytdl.cookie_saves")
+
+    @staticmethod
+    def retire(ydl: YoutubeDL) -> None:
+        """
+        Close instance without saving its cookies, which would overwrite the
+        newer file that replaced them.
+
+        Args:
+            ydl: YoutubeDL
+        """
+        ydl.params["cookiefile"] = None
+        ydl.close()
+
+
+ydl_cache = YoutubeDLCache(ydl_cookie_file, ydl_cookie_save_interval)
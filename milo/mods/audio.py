@@ -1,26 +1,54 @@
 from __future__ import annotations
-import os
-import tempfile
 import validators
-from asyncio import TimeoutError, sleep
+from asyncio import (
+    Event,
+    TimeoutError,
+    create_task,
+    gather,
+    get_running_loop,
+)
 from discord import (
     ClientException,
-    FFmpegPCMAudio,
+    FFmpegOpusAudio,
     utils,
     VoiceState,
 )
-from dotenv import load_dotenv
 from typing import TYPE_CHECKING, Union
-from yt_dlp import YoutubeDL
-from milo.globals import voice_client_tts_max_chars
+from milo.globals import (
+    app_logger,
+    audio_extraction_timeout,
+    audio_extraction_workers,
+    voice_client_tts_max_chars,
+)
+from milo.handler.track_queue import Track, track_queue
+from milo.handler.voice_idle import idle_disconnect
 from milo.helpers.action_decorators import no_response, simple_response
+from milo.helpers.cache import normalize_message
+from milo.helpers.discord.audio import AudioStream
+from milo.helpers.metrics import metrics
+from milo.helpers.singleflight import SingleFlight
+from milo.helpers.stream_cache import stream_cache, youtube_stream_id
+from milo.helpers.tool_registry import tool
+from milo.helpers.tts_cache import tts_cache
+from milo.helpers.worker_pool import WorkerPool
+from milo.helpers.ytdl import ydl_cache
 
 if TYPE_CHECKING:
-    from discord import Message, VoiceClient
+    from discord import AudioSource, Message, VoiceClient
+    from typing import Callable, Optional
     from milo.handler.discord import DiscordHandler
     from milo.handler.llm import LLMHandler
 
 
+extraction_flight = SingleFlight("audio.extraction_flight")
+extraction_pool = WorkerPool("audio.extraction_pool", audio_extraction_workers)
+ffmpeg_options = {
+    "options": "-vn",
+    "before_options": """-reconnect 1 -reconnect_streamed 1
+    -reconnect_delay_max 5""",
+}
+
+
 class DiscordAudio:
     """
     Class to handle the bot interacting in Discord voice channels.
@@ -46,45 +74,112 @@ class DiscordAudio:
         self.voice_state_user: VoiceState = message.author.voice
         self.args = args
 
-    @property
-    def ydl_opts(self) -> dict:
+    def extract_audio_info(self, query: str) -> dict:
         """
-        Options to be used with yt-dlp.
+        Get title and audio URL from URL or by searching YouTube. Blocks
+        while yt-dlp runs.
+
+        Args:
+            query: str
 
         Returns:
             dict
         """
-        load_dotenv()
-        proxy = os.getenv("PROXY")
+        yt_domains = ["youtube.com", "youtu.be"]
+        is_youtube = any(i in query for i in yt_domains)
 
+        if validators.url(query) and not is_youtube:
+            # play directly from URL if the source is not YouTube
+            ydl = ydl_cache.get("proxy")
+            info_searched = ydl.extract_info(query, download=False)
+            ydl_cache.save_cookies(ydl)
+            return self.audio_info(info_searched)
+
+        # don't use proxy if using YouTube
+        ydl = ydl_cache.get("direct")
+
+        if not validators.url(query):
+            query = f"{query} audio"  # search specifically for audio
+
+        info_searched = ydl.extract_info(f"ytsearch1:{query}", download=False)
+        ydl_cache.save_cookies(ydl)
+        return self.audio_info(info_searched["entries"][0])
+
+    @staticmethod
+    def audio_info(info: dict) -> dict:
+        """
+        Keep what is needed to play and cache a yt-dlp result.
+
+        Args:
+            info: dict
+
+        Returns:
+            dict
+        """
+        extractor = info.get("extractor_key") or info.get("extractor", "")
         return {
-            "verbose": False,
-            "geo-bypass": True,
-            "format": "bestaudio/best",
-            "quiet": True,
-            "noplaylist": True,
-            "playlist_items": "1",
-            "extractaudio": True,
-            "audio-format": "mp3",
-            "postprocessors": [
-                {
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": "mp3",
-                    "preferredquality": "192",
-                }
-            ],
-            "nocheckcertificate": True,
-            "proxy": proxy,
-            "cookiefile": "./data/system/youtube_cookies.txt",
-            "skip_download": True,
-            "ignore-errors": True,
+            "url": info["url"],
+            "title": info["title"],
+            "duration": info.get("duration"),
+            # opus streams are played without transcoding
+            "codec": info.get("acodec"),
+            # URLs of the same video can differ, the extractor's id does not
+            "id": f"{extractor.lower()}:{info.get('id') or info['url']}",
         }
 
+    async def resolve_audio(self, query: str) -> dict:
+        """
+        Get title and audio URL from the stream cache or on the extraction
+        pool so the event loop is not blocked. Identical queries that run at
+        the same time share one extraction.
+
+        Args:
+            query: str
+
+        Returns:
+            dict
+        """
+        stream_id = None
+        # URLs can be case sensitive
+        if validators.url(query.strip()):
+            key = query.strip()
+            stream_id = youtube_stream_id(key)
+        else:
+            key = normalize_message(query)
+
+        info = await stream_cache.get(key, stream_id)
+        if info is not None:
+            return info
+
+        async def extract() -> dict:
+            info = await extraction_pool.run(
+                self.extract_audio_info,
+                query,
+                timeout=audio_extraction_timeout,
+            )
+            stream_cache.set(key, info)
+            return info
+
+        return await extraction_flight.do(
+            key, extract, timeout=audio_extraction_timeout
+        )
+
+    def check_voice_state(self) -> None:
+        """
+        Check that the user is in a voice channel before doing anything slow.
+
+        Raises:
+            ClientException: Exception
+                The user is not in a voice channel.
+        """
+        if self.voice_state_user is None:
+            raise ClientException("User must be connected to voice channel.")
+
     async def get_voice_client(self) -> Union[VoiceClient, None]:
         """
         Get voice client if it exists or connect to voice channel and
         create voice client. The voice client will always be associated
-        with the user.
+        with the user. Callers hold the guild's voice lock.
 
         Raises:
             ClientException: Exception
@@ -93,16 +188,15 @@ class DiscordAudio:
         Returns:
             Union[VoiceClient, None]
         """
-        if self.voice_state_user is None:
-            raise ClientException("User must be connected to voice channel.")
+        self.check_voice_state()
 
         voice_client = utils.get(
             self.dc_handler.client.voice_clients, guild=self.message.guild
         )
 
         if voice_client is not None:
-            # return voice_client if exists already. if user is in a different
-            # voice channel, disconnect and don't exit function
+            # return voice_client if exists already. if user is in a
+            # different voice channel, disconnect and don't exit function
             if voice_client.channel == self.voice_state_user.channel:
                 return voice_client
             else:
@@ -118,114 +212,430 @@ class DiscordAudio:
         except ClientException as e:
             raise ClientException(e)
 
-    async def play_from_file(self, filepath: str) -> None:
+    def play(
+        self,
+        voice_client: VoiceClient,
+        source: AudioSource,
+        after: Optional[Callable[[Optional[Exception]], None]] = None,
+    ) -> None:
         """
-        Play audio file in Discord voice channel.
+        Stop whatever is playing and play audio source. The voice client
+        is not disconnected for being idle until the source is done. A
+        queued track that is replaced does not continue the queue.
 
         Args:
-            filepath (): str
+            voice_client: VoiceClient
+            source: AudioSource
+            after: Optional[Callable[[Optional[Exception]], None]]
+                Called from the audio player thread when the source is done.
         """
-        try:
-            voice_client = await self.get_voice_client()
-        except Exception as e:
-            raise Exception(e)
-
+        # the replaced track's after callback must not start the next one
+        track_queue.release(voice_client.guild.id)
         if voice_client.is_playing():
             voice_client.stop()
 
-        ffmpeg_options = {"options": "-vn"}
+        def finished(error: Optional[Exception]) -> None:
+            idle_disconnect.idle_threadsafe(voice_client)
+            if after is not None:
+                after(error)
 
-        source = FFmpegPCMAudio(source=filepath, **ffmpeg_options)
-        voice_client.play(source)
-        while voice_client.is_playing():
-            await sleep(1)
+        idle_disconnect.busy(voice_client)
+        voice_client.play(source, after=finished)
 
+    def play_source(
+        self, voice_client: VoiceClient, source: AudioSource
+    ) -> Event:
+        """
+        Play audio source in Discord voice channel.
+
+        Args:
+            voice_client: VoiceClient
+            source: AudioSource
+
+        Returns:
+            Event
+                Set when the source is done or replaced by another source.
+        """
+        loop = get_running_loop()
+        done = Event()
+        self.play(
+            voice_client,
+            source,
+            after=lambda e: loop.call_soon_threadsafe(done.set),
+        )
+        return done
+
+    async def feed_speech(
+        self, audio_stream: AudioStream, text: str, path: str
+    ) -> None:
+        """
+        Stream speech into audio_stream and save it to the cache at path.
+
+        Args:
+            audio_stream: AudioStream
+            text: str
+            path: str
+        """
+        try:
+            with tts_cache.writer(path) as temp_path:
+                with open(temp_path, "wb") as f:
+                    async for chunk in self.llm_handler.stream_speech(text):
+                        audio_stream.feed(chunk)
+                        f.write(chunk)
+        finally:
+            audio_stream.end()
+
+    @tool(
+        description="""Use this function if the user wants to
+        say a piece of text.""",
+        properties={
+            "text": {
+                "type": "string",
+                "description": """Just text. Whatever comes
+                after say""",
+            }
+        },
+    )
     @no_response
     async def say_text(self) -> Union[str, None]:
         """
-        Creates audio file from text as a temp file and play it.
+        Say text in voice channel. Audio is played while it is being created
+        and cached so repeated text is played without creating it again.
+        Speech replaces the track that is playing; the tracks waiting in the
+        queue resume when it ends.
 
         Returns:
             Union[str, None]
         """
+        path = tts_cache.path_for(
+            self.args["text"],
+            self.llm_handler.tts_voice,
+            self.llm_handler.tts_model,
+            self.llm_handler.tts_format,
+        )
 
-        # summarize if text is too long
-        if len(self.args["text"]) > voice_client_tts_max_chars:
-            text = await self.llm_handler.summarize_text(
-                self.args["text"], voice_client_tts_max_chars
-            )
-            text = f"I'm summarizing: {text}"
-        else:
-            text = self.args["text"]
+        try:
+            self.check_voice_state()
+        except Exception as e:
+            return f"{e}"
 
-        temp_file = tempfile.NamedTemporaryFile(suffix=".opus")
-        await self.llm_handler.text_to_speech(temp_file.name, text)
+        text = None
+        if not tts_cache.get(path):
+            # summarize if text is too long
+            if len(self.args["text"]) > voice_client_tts_max_chars:
+                try:
+                    text = await self.llm_handler.summarize_text(
+                        self.args["text"], voice_client_tts_max_chars
+                    )
+                except Exception as e:
+                    return f"{e}"
+                text = f"I'm summarizing: {text}"
+            else:
+                text = self.args["text"]
 
+        feeding = None
         try:
-            await self.play_from_file(temp_file.name)
+            # held until the speech starts so that a stop can still end it
+            async with track_queue.lock(self.message.guild.id):
+                try:
+                    voice_client = await self.get_voice_client()
+                except Exception as e:
+                    return f"{e}"
+
+                if text is None:
+                    source = FFmpegOpusAudio(path, codec="copy", options="-vn")
+                else:
+                    audio_stream = AudioStream()
+                    feeding = create_task(
+                        self.feed_speech(audio_stream, text, path)
+                    )
+                    source = FFmpegOpusAudio(
+                        audio_stream, pipe=True, codec="copy"
+                    )
+
+                done = self.play_source(voice_client, source)
+
+            try:
+                await done.wait()
+                if feeding is not None:
+                    await feeding
+            finally:
+                self.resume_queue(voice_client)
         except Exception as e:
             return f"{e}"
-
-    @simple_response
-    async def stream_audio(self) -> str:
+        finally:
+            if feeding is not None:
+                # nobody reads the speech if playing failed. does nothing if
+                # it was already awaited
+                feeding.cancel()
+                await gather(feeding, return_exceptions=True)
+
+    async def create_source(self, info: dict) -> FFmpegOpusAudio:
         """
-        Stream audio from URL or search YouTube and stream result.
+        Create audio source for a resolved stream. Opus streams are copied
+        so FFmpeg doesn't decode them and discord.py doesn't encode them
+        again. Other codecs are transcoded to Opus by FFmpeg. Streams with
+        an unknown codec are probed first.
+
+        Args:
+            info: dict
 
         Returns:
-            str
+            FFmpegOpusAudio
         """
+        codec = info.get("codec")
+        bitrate = None
+        if codec in (None, "none"):
+            codec, bitrate = await FFmpegOpusAudio.probe(info["url"])
+            metrics.incr("audio.probed")
+
+        if codec == "opus":
+            metrics.incr("audio.passthrough")
+        else:
+            metrics.incr("audio.transcoded")
+        return FFmpegOpusAudio(
+            info["url"], codec=codec, bitrate=bitrate, **ffmpeg_options
+        )
 
-        try:
-            voice_client = await self.get_voice_client()
-        except Exception as e:
-            return f"{e}"
+    def play_track(
+        self,
+        voice_client: VoiceClient,
+        track: Track,
+        source: AudioSource,
+    ) -> None:
+        """
+        Play resolved track and take the next one from the queue when it
+        ends.
+
+        Args:
+            voice_client: VoiceClient
+            track: Track
+            source: AudioSource
+        """
+        loop = get_running_loop()
+        guild_id = voice_client.guild.id
+
+        def finished(error: Optional[Exception]) -> None:
+            if error is not None:
+                app_logger.error(f"Playing {track.title!r} failed: {error}")
+            loop.call_soon_threadsafe(self.track_finished, voice_client, track)
+
+        self.play(voice_client, source, after=finished)
+        # play releases whatever was current
+        track_queue.current[guild_id] = track
+
+    def track_finished(self, voice_client: VoiceClient, track: Track) -> None:
+        """
+        Start the next track if track ended while it was still current.
+
+        Args:
+            voice_client: VoiceClient
+            track: Track
+        """
+        if track_queue.is_current(voice_client.guild.id, track):
+            track_queue.start(self.continue_queue(voice_client))
+
+    async def play_next(self, voice_client: VoiceClient) -> Optional[dict]:
+        """
+        Take the next track from the guild's queue, play it and prefetch the
+        one after it.
+
+        Args:
+            voice_client: VoiceClient
+
+        Raises:
+            Exception
+                The track could not be resolved.
+
+        Returns:
+            Optional[dict]
+                Info of the track, None if the queue is empty or the track
+                was skipped or stopped before it started.
+        """
+        guild_id = voice_client.guild.id
+        # takes the track before anything is awaited so that concurrent
+        # requests in the guild queue up behind it
+        track = track_queue.next(guild_id)
+        if track is None:
+            return None
+        track_queue.prefetch(guild_id, self.resolve_audio)
 
         try:
-            query = self.args["query"]
+            info = await track_queue.resolve(track, self.resolve_audio)
+            source = await self.create_source(info)
+        except Exception:
+            if track_queue.is_current(guild_id, track):
+                track_queue.release(guild_id)
+            raise
+
+        async with track_queue.lock(guild_id):
+            # skipped, stopped or disconnected while resolving
+            if (
+                track_queue.is_current(guild_id, track)
+                and voice_client.is_connected()
+            ):
+                self.play_track(voice_client, track, source)
+                return info
+            source.cleanup()
+            return None
+
+    async def continue_queue(self, voice_client: VoiceClient) -> None:
+        """
+        Play the next track that can be resolved.
 
-            yt_domains = ["youtube.com", "youtu.be"]
-            is_youtube = any(i in query for i in yt_domains)
+        Args:
+            voice_client: VoiceClient
+        """
+        while True:
+            try:
+                await self.play_next(voice_client)
+                return
+            except Exception as e:
+                app_logger.warning(f"Skipping track that failed: {e}")
+
+    def resume_queue(self, voice_client: VoiceClient) -> None:
+        """
+        Continue the guild's queue if tracks are waiting and nothing is
+        playing, for example after speech replaced a track or the track
+        that was requested first could not be resolved.
 
-            if validators.url(query) and not is_youtube:
-                # play directly from URL if the source is not YouTube
-                with YoutubeDL(self.ydl_opts) as ydl:
-                    info_searched = ydl.extract_info(query, download=False)
-                    audio_url = info_searched["url"]
-                    title = info_searched["title"]
-            else:
-                # don't use proxy if using YouTube
-                ydl_opts = self.ydl_opts
-                ydl_opts.pop("proxy")
+        Args:
+            voice_client: VoiceClient
+        """
+        guild_id = voice_client.guild.id
+        if (
+            track_queue.playing(guild_id) is None
+            and track_queue.waiting(guild_id)
+            and not voice_client.is_playing()
+        ):
+            track_queue.start(self.continue_queue(voice_client))
+
+    @tool(
+        description="""Use this function if the user wants to
+        play audio that'll be streamed. Adds it to the queue if something
+        is already playing.""",
+        properties={
+            "query": {
+                "type": "string",
+                "description": """A song title or URL.""",
+            }
+        },
+    )
+    @simple_response
+    async def stream_audio(self) -> Union[dict, str]:
+        """
+        Queue audio from URL or YouTube search and start playing the queue
+        if nothing from it is playing.
 
-                if not validators.url(query):
-                    query = f"{query} audio"  # search specifically for audio
+        Returns:
+            Union[dict, str]
+                Title of what is playing, position in the queue or error.
+        """
 
-                with YoutubeDL(ydl_opts) as ydl:
-                    info_searched = ydl.extract_info(
-                        f"ytsearch1:{query}", download=False
-                    )
-                    audio_url = info_searched["entries"][0]["url"]
-                    title = info_searched["entries"][0]["title"]
+        guild_id = self.message.guild.id
+        async with track_queue.lock(guild_id):
+            try:
+                voice_client = await self.get_voice_client()
+            except Exception as e:
+                return f"{e}"
+
+            track = Track(self.args["query"], self.message.author.display_name)
+            position = track_queue.enqueue(guild_id, track)
+            if position is None:
+                return "the queue is full"
+
+            if track_queue.playing(guild_id) is not None:
+                track_queue.prefetch(guild_id, self.resolve_audio)
+                return {
+                    "type": "queued",
+                    "query": track.query,
+                    "position": position,
+                }
 
+        # resolved without the lock. play_next made the track current, so
+        # a stop or skip meanwhile keeps it from playing
+        try:
+            info = await self.play_next(voice_client)
         except Exception as e:
+            # tracks queued while this one was resolving
+            self.resume_queue(voice_client)
             return f"An error occured: {e}"
 
-        else:
+        if info is None:
+            return "stopped before it started"
+        return {"type": "playing", "title": info["title"]}
 
-            ffmpeg_options = {
-                "options": "-vn",
-                "before_options": """-reconnect 1 -reconnect_streamed 1
-                -reconnect_delay_max 5""",
-            }
-
-            source = FFmpegPCMAudio(audio_url, **ffmpeg_options)
+    @tool(
+        description="""Use this function if the user wants to
+        skip the song that is playing.""",
+    )
+    @simple_response
+    async def skip(self) -> Union[str, None]:
+        """
+        Skip the current track and play the next one in the queue.
 
-            if voice_client.is_playing():
+        Returns:
+            Union[str, None]
+        """
+        guild_id = self.message.guild.id
+        async with track_queue.lock(guild_id):
+            try:
+                voice_client = await self.get_voice_client()
+            except Exception as e:
+                return f"{e}"
+
+            if track_queue.playing(guild_id) is None:
+                return "nothing playing"
+
+            if voice_client.is_playing() or voice_client.is_paused():
+                # the after callback starts the next track
                 voice_client.stop()
-            voice_client.play(source)
+            else:
+                # still resolving
+                track_queue.release(guild_id)
+                track_queue.start(self.continue_queue(voice_client))
+        return "skipped"
+
+    @tool(
+        description="""Use this function if the user wants to
+        see the songs in the queue.""",
+    )
+    @simple_response
+    async def list_queue(self) -> dict:
+        """
+        List the current track and the tracks waiting in the queue.
 
-            return title
+        Returns:
+            dict
+        """
+        guild_id = self.message.guild.id
+        playing = track_queue.playing(guild_id)
+        return {
+            "type": "queue",
+            "playing": playing.title if playing else None,
+            "queue": [track.title for track in track_queue.tracks(guild_id)],
+        }
+
+    @tool(
+        description="""Use this function if the user wants to
+        clear the queue of songs.""",
+    )
+    @simple_response
+    async def clear_queue(self) -> str:
+        """
+        Remove the tracks waiting in the queue. The current track keeps
+        playing.
 
+        Returns:
+            str
+        """
+        removed = track_queue.clear(self.message.guild.id)
+        return f"removed {removed} tracks from the queue"
+
+    @tool(
+        description="""Use this function if the user wants to
+        pause sound.""",
+    )
     @simple_response
     async def pause(self) -> Union[str, None]:
         """
@@ -234,18 +644,24 @@ class DiscordAudio:
         Returns:
             Union[str, None]
         """
-        try:
-            voice_client = await self.get_voice_client()
-        except Exception as e:
-            return f"{e}"
-
-        if voice_client.is_paused():
-            return "already paused"
-        elif voice_client.is_playing():
-            voice_client.pause()
-        else:
-            return "nothing playing"
+        async with track_queue.lock(self.message.guild.id):
+            try:
+                voice_client = await self.get_voice_client()
+            except Exception as e:
+                return f"{e}"
+
+            if voice_client.is_paused():
+                return "already paused"
+            elif voice_client.is_playing():
+                voice_client.pause()
+                idle_disconnect.idle(voice_client)
+            else:
+                return "nothing playing"
 
+    @tool(
+        description="""Use this function if the user wants to
+        resume sound.""",
+    )
     @simple_response
     async def resume(self) -> Union[str, None]:
         """
@@ -254,32 +670,44 @@ class DiscordAudio:
         Returns:
             Union[str, None]
         """
-        try:
-            voice_client = await self.get_voice_client()
-        except Exception as e:
-            return f"{e}"
-
-        if voice_client.is_paused():
-            voice_client.resume()
-        elif voice_client.is_playing():
-            return "already playing"
-        else:
-            return "nothing playing"
+        async with track_queue.lock(self.message.guild.id):
+            try:
+                voice_client = await self.get_voice_client()
+            except Exception as e:
+                return f"{e}"
+
+            if voice_client.is_paused():
+                voice_client.resume()
+                idle_disconnect.busy(voice_client)
+            elif voice_client.is_playing():
+                return "already playing"
+            else:
+                return "nothing playing"
 
+    @tool(
+        description="""Use this function if the user wants to
+        stop sound.""",
+    )
     @simple_response
     async def stop(self) -> Union[str, None]:
         """
-        Stops whatever is playing in voice client.
+        Stops whatever is playing in voice client and clears the queue.
 
         Returns:
             Union[str, None]
         """
-        try:
-            voice_client = await self.get_voice_client()
-        except Exception as e:
-            return f"{e}"
-
-        if voice_client.is_playing():
-            voice_client.stop()
-        else:
-            return "nothing playing"
+        guild_id = self.message.guild.id
+        async with track_queue.lock(guild_id):
+            try:
+                voice_client = await self.get_voice_client()
+            except Exception as e:
+                return f"{e}"
+
+            # a track being resolved is no longer current, so it won't play
+            resolving = track_queue.playing(guild_id) is not None
+            track_queue.forget(guild_id)
+            if voice_client.is_playing():
+                voice_client.stop()
+                idle_disconnect.idle(voice_client)
+            elif not resolving:
+                return "nothing playing"
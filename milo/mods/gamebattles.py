@@ -1,2 +1,49 @@
-def get_schedule() -> list:
-    return "This will give a schedule."
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from milo.helpers.action_decorators import simple_response
+from milo.helpers.tool_registry import tool
+
+if TYPE_CHECKING:
+    from discord import Message
+    from milo.handler.discord import DiscordHandler
+    from milo.handler.llm import LLMHandler
+
+
+class GameBattles:
+    """
+    Class to handle scrims and game battles.
+
+    Attributes:
+        dc_handler: DiscordHandler
+        llm_handler: LLMHandler
+        message: Message
+        args: dict
+    """
+
+    def __init__(
+        self,
+        dc_handler: DiscordHandler,
+        message: Message,
+        args: dict,
+        llm_handler: LLMHandler = None,
+    ) -> None:
+        self.dc_handler = dc_handler
+        self.llm_handler = llm_handler
+        self.message = message
+        self.args = args
+
+    @tool(
+        description="""Get the schedule for scrims or game
+        battles. Call this whenever you need to see all sessions
+        for upcoming scrims or game battles or example when a
+        customer asks 'scrims?' or 'schedule'""",
+    )
+    @simple_response
+    async def get_schedule(self) -> str:
+        """
+        Get the schedule for upcoming sessions.
+
+        Returns:
+            str
+        """
+        return "This will give a schedule."
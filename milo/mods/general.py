@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 from milo.helpers.action_decorators import simple_response
+from milo.helpers.tool_registry import tool
 
 if TYPE_CHECKING:
     from discord import Message
@@ -32,7 +33,13 @@ class General:
         self.message = message
         self.args = args
 
-    @simple_response
+    @tool(
+        description="""Use this function as the default
+        function. Call this function either when the user wants to
+        know about our capabilities/features or when there is no
+        proper match for any other function.""",
+    )
+    @simple_response(llm_format=True)
     async def default(self) -> str:
         """
         Sends the base response when there are no other options.
@@ -1,13 +1,13 @@
 from __future__ import annotations
 from playhouse.shortcuts import model_to_dict
 from typing import TYPE_CHECKING
-import toml
 from milo.handler.database import SettingsServer
 from milo.helpers.action_decorators import (
     admin_privileges,
     confirm_decision_response,
     simple_response,
 )
+from milo.helpers.tool_registry import tool
 
 if TYPE_CHECKING:
     from discord import Message
@@ -18,6 +18,7 @@ if TYPE_CHECKING:
 
 groups = ["server"]  # used in other places like llm.py as an enum
 group_data = {"server": {"table_model": SettingsServer}}
+group_properties = {"group": {"type": "string", "enum": groups}}
 
 
 class Settings:
@@ -124,6 +125,11 @@ class Settings:
             )
         return dictionary
 
+    @tool(
+        description="""Use this function to get and show
+        settings.""",
+        properties=group_properties,
+    )
     @simple_response
     async def get_settings_as_dict(self) -> dict:
         """
@@ -134,6 +140,13 @@ class Settings:
         """
         return self.fields_extra_data
 
+    @tool(
+        description="""Only use this function if the user
+        explicitly mentions that they want to reset settings.
+        The user has to use the word settings. Do not use if
+        the user only mentions the word default or reset.""",
+        properties=group_properties,
+    )
     @admin_privileges
     @confirm_decision_response(additional_process=None)
     async def reset_settings(self) -> None:
@@ -150,6 +163,11 @@ class Settings:
         )
         q.execute()
 
+    @tool(
+        description="""Use this function if the user wants to
+        edit the settings.""",
+        properties=group_properties,
+    )
     @admin_privileges
     @confirm_decision_response(additional_process="form")
     async def edit_settings(self, updated_settings: dict) -> None:
@@ -184,6 +202,8 @@ def insert_default_settings_from_file(group: str) -> None:
         case _:
             raise ValueError(f"Group '{group}' does not exist.'")
 
+    import toml
+
     with open("data/system/settings.default.toml", "r") as f:
         settings = toml.load(f)
 